@@ -0,0 +1,824 @@
+import argparse
+import base64
+import concurrent.futures
+import contextlib
+import datetime
+import html
+import io
+import json
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cities
+import convert
+import odoo
+import output
+import scrape
+import sheets
+
+SCRAPER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Importing each of these modules must take less than this many milliseconds.
+STARTUP_MODULES = ("scrape", "convert")
+STARTUP_BUDGET_MS = 150
+
+# Heavy dependencies that must only be imported by the code paths using them.
+LAZY_MODULES = (
+    "babel",
+    "bs4",
+    "dateparser",
+    "googleapiclient",
+    "jinja2",
+    "pyppeteer",
+    "requests",
+    "requests_html",
+)
+
+# Numbers of events of the synthetic calendars, see --sizes.
+SIZES = (1000, 10000)
+
+# Each timing is the best of this many runs.
+RUNS = 5
+
+# A timing is a regression if it is more than REGRESSION_FACTOR times its baseline, and
+# slower by at least REGRESSION_MIN_SECONDS so that noise on tiny timings is ignored.
+REGRESSION_FACTOR = 1.5
+REGRESSION_MIN_SECONDS = 0.01
+
+# The real pages of testdata/, with the calendar URL they were downloaded from.
+TESTDATA_PAGES = (
+    ("FdA.html", "https://www.billetweb.fr/multi_event.php?user=128593"),
+    ("FdConstruction.html", "https://www.billetweb.fr/multi_event.php?user=138110"),
+    ("EventBrite.html", "https://www.eventbrite.ch/o/la-fresque-du-climat-suisse"),
+)
+
+# Number of events the fast extractors must find in the testdata pages, with the calendar
+# URL they were downloaded from.
+TESTDATA_FAST_EVENTS = (
+    ("EventBrite.html", "https://www.eventbrite.ch/o/la-fresque-du-climat-suisse", 2),
+)
+
+# Locations of the synthetic events, mostly in Switzerland.
+SYNTHETIC_PLACES = (
+    "Impact Hub Lausanne, Av. de Sévelin 52, 1004 Lausanne",
+    "Rue Fendt 1, 1201 Genève",
+    "Sihlquai 131, 8005 Zürich",
+    "Passage du Cardinal 1, 1700 Fribourg",
+    "Rue de la Paix 10, 75002 Paris",
+)
+
+_IMPORT_TIME = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)")
+
+
+# Imports "module" in a new interpreter with -X importtime.
+# Returns (cumulative import time in microseconds, set of the modules it imported).
+def measure_import(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        capture_output=True,
+        text=True,
+        cwd=SCRAPER_DIR,
+        check=True,
+    )
+    total = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        m = _IMPORT_TIME.match(line)
+        if not m:
+            continue
+        imported.add(m.group(3).split(".")[0])
+        if m.group(3) == module and not m.group(2):
+            total = int(m.group(1))
+    return total, imported
+
+
+# Checks the startup time of the scripts, taking the best of "runs" cold starts.
+# Records the import times in "results" and returns the list of budget violations.
+def check_startup(results, sizes, runs=5):
+    problems = []
+    for module in STARTUP_MODULES:
+        best = None
+        for _ in range(runs):
+            total, imported = measure_import(module)
+            if best is None or total < best:
+                best = total
+        print("import %s: %.1f ms" % (module, best / 1000))
+        results["startup." + module] = best / 1e6
+        if best > STARTUP_BUDGET_MS * 1000:
+            problems.append(
+                "import %s took %.1f ms, the budget is %d ms"
+                % (module, best / 1000, STARTUP_BUDGET_MS)
+            )
+        for lazy in LAZY_MODULES:
+            if lazy in imported:
+                problems.append("import %s loads %s" % (module, lazy))
+    return problems
+
+
+# Yields "n" (date, place, url) of synthetic events over the coming year.
+def synthetic_events(n):
+    today = datetime.date.today()
+    for i in range(n):
+        date = today + datetime.timedelta(days=1 + i % 300)
+        place = SYNTHETIC_PLACES[i % len(SYNTHETIC_PLACES)]
+        yield date, place, "https://example.org/e%d" % i
+
+
+# Returns a BilletWeb calendar page of "n" events.
+def synthetic_BilletWeb(n):
+    parts = ["<html><body>"]
+    for date, place, url in synthetic_events(n):
+        parts.append(
+            '<div class="multi_event_container">'
+            '<span class="multi_event_name_span">Fresque du Climat</span>'
+            '<div class="multi_event_date"><span>%s</span></div>'
+            '<div class="multi_event_place"><span>%s</span></div>'
+            '<div class="multi_event_button"><a href="%s">Go</a></div></div>\n'
+            % (date.strftime("%a %b %d, %Y"), html.escape(place), url)
+        )
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+# Returns a BilletWeb shop page of "n" sessions, embedded as base64 JSON after the markup
+# of their ticket rows.
+def synthetic_BilletWebShop(n):
+    sessions = []
+    rows = []
+    for date, place, url in synthetic_events(n):
+        start = datetime.datetime.combine(date, datetime.time(12))
+        sessions.append({"start_day": int(start.timestamp()), "place": place})
+        rows.append(
+            '<div class="session"><span class="date">%s</span><span>%s</span></div>\n'
+            % (date.isoformat(), html.escape(place))
+        )
+    payload = json.dumps({"status": "open", "payload": sessions})
+    return (
+        "<html><body>%s<script>var json_session_data=JSON.parse(Base64.decode('%s'));"
+        "</script></body></html>"
+        % ("".join(rows), base64.b64encode(payload.encode("ascii")).decode("ascii"))
+    )
+
+
+# Returns an Eventbrite organizer page of "n" events, listed in its server data.
+def synthetic_EventBrite(n):
+    events = []
+    for date, place, url in synthetic_events(n):
+        events.append(
+            {
+                "name": {"text": "Atelier Fresque du Climat"},
+                "start": {"local": date.isoformat() + "T18:30:00"},
+                "url": url,
+                "online_event": False,
+                "venue": {"address": {"localized_address_display": place}},
+            }
+        )
+    data = {"view_data": {"events": {"future_events": events}}}
+    return (
+        "<html><body><script>window.__SERVER_DATA__ = %s;</script></body></html>"
+        % json.dumps(data)
+    )
+
+
+# Returns an Eventbrite organizer page of "n" events, as rendered by its JavaScript: the
+# events are in a card list, among other markup.
+def synthetic_EventBriteCards(n):
+    parts = ['<html><body><ul class="nav"><li>Organizers</li></ul>']
+    parts.append('<ul class="cc-card-list">')
+    for date, place, url in synthetic_events(n):
+        parts.append(
+            '<li class="cc-card-list__item"><article>'
+            '<h3 class="eds-event-card-content__title">'
+            '<div class="eds-is-hidden-accessible">Atelier Fresque du Climat</div></h3>'
+            '<div class="eds-event-card-content__sub-title">%s, 6:30 PM</div>'
+            '<div data-subcontent-key="location">%s</div>'
+            '<a class="eds-event-card-content__action-link" href="%s">Go</a>'
+            "</article></li>\n" % (date.strftime("%a, %b %d"), html.escape(place), url)
+        )
+    parts.append("</ul></body></html>")
+    return "".join(parts)
+
+
+FRENCH_MONTHS = (
+    "janvier",
+    "février",
+    "mars",
+    "avril",
+    "mai",
+    "juin",
+    "juillet",
+    "août",
+    "septembre",
+    "octobre",
+    "novembre",
+    "décembre",
+)
+
+
+# Returns a Fresque du Climat page of "n" workshops, after a container with more classes
+# that the scraper must skip.
+def synthetic_FresqueDuClimat(n):
+    parts = [
+        '<html><body><div class="my-3 d-none"><a class="text-decoration-none"></a>'
+    ]
+    parts.append('</div><div class="my-3">')
+    for date, place, url in synthetic_events(n):
+        day = "%d %s %d" % (date.day, FRENCH_MONTHS[date.month - 1], date.year)
+        parts.append(
+            '<a class="text-decoration-none" href="/w/%s">'
+            '<div class="flex-grow-1"><div><small class="text-secondary">'
+            "%s · 18:30 · %s</small></div><div>Fresque du Climat (Français)</div>"
+            "</div></a>\n" % (url.rsplit("/", 1)[1], day, html.escape(place))
+        )
+    parts.append("</div></body></html>")
+    return "".join(parts)
+
+
+# Returns an iCalendar file of "n" events.
+def synthetic_ICal(n):
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0"]
+    for date, place, url in synthetic_events(n):
+        lines += [
+            "BEGIN:VEVENT",
+            "DTSTART:" + date.strftime("%Y%m%d") + "T180000Z",
+            "SUMMARY:Fresque du Textile",
+            "LOCATION:" + place.replace(",", "\\,") + "\\, Suisse",
+            "URL:" + url,
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines) + "\r\n"
+
+
+# (platform, synthetic page generator, calendar URL), see scrape.extract_events().
+SYNTHETIC_CALENDARS = (
+    ("BilletWeb", synthetic_BilletWeb, "https://www.billetweb.fr/multi_event.php"),
+    (
+        "BilletWebShop",
+        synthetic_BilletWebShop,
+        "https://www.billetweb.fr/shop.php?id=1",
+    ),
+    ("EventBrite", synthetic_EventBrite, "https://www.eventbrite.ch/o/synthetic"),
+    ("ICal", synthetic_ICal, "https://example.org/synthetic.ics"),
+)
+
+
+# Returns the best time in seconds of "runs" calls to "function", hiding what it prints.
+def timed(function, runs=RUNS):
+    best = None
+    for _ in range(runs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def record(results, name, seconds):
+    print("%s: %.1f ms" % (name, seconds * 1000))
+    results[name] = seconds
+
+
+# Times the scrapers on the testdata pages and on synthetic calendars of each size.
+def check_scrapers(results, sizes):
+    for page, url in TESTDATA_PAGES:
+        filename = os.path.join(SCRAPER_DIR, "testdata", page)
+        seconds = timed(
+            lambda: scrape.extract_events(filename, url, page, "fr", "html.parser")
+        )
+        record(results, "scraper.testdata." + page, seconds)
+    with tempfile.TemporaryDirectory() as directory:
+        for platform, generate, url in SYNTHETIC_CALENDARS:
+            for size in sizes:
+                filename = os.path.join(directory, "%s_%d.html" % (platform, size))
+                with open(filename, "w") as f:
+                    f.write(generate(size))
+                seconds = timed(
+                    lambda: scrape.extract_events(
+                        filename, url, platform, "fr", "html.parser"
+                    )
+                )
+                record(results, "scraper.%s.%d" % (platform, size), seconds)
+    return []
+
+
+# Returns "n" events as returned by the scrapers, sorted by day, with duplicates.
+def synthetic_scraped_events(n):
+    events = []
+    for date, place, url in synthetic_events(n):
+        events.append(
+            sheets.Event(
+                name="Fresque de la Biodiversité",
+                date=date,
+                location=place,
+                url=url,
+                language="fr" if len(events) % 3 else "en",
+            )
+        )
+    events.sort(key=scrape.event_day)
+    return events
+
+
+# Times the stages of the event pipeline on synthetic events of each size.
+def check_pipeline(results, sizes):
+    for size in sizes:
+        events = synthetic_scraped_events(size)
+        with contextlib.redirect_stdout(io.StringIO()):
+            located = list(scrape.append_city_and_filter_for_switzerland(events, False))
+            unique = list(scrape.remove_duplicates(located))
+
+        def append_city():
+            for _ in scrape.append_city_and_filter_for_switzerland(events, False):
+                pass
+
+        # Without the resolutions of the previous runs.
+        def append_city_cold():
+            resolver = cities.LocationResolver(
+                cities.load_gazetteer(), cities.load_overrides()
+            )
+            for _ in scrape.append_city_and_filter_for_switzerland(
+                events, False, resolver
+            ):
+                pass
+
+        def dedup():
+            for _ in scrape.remove_duplicates(located):
+                pass
+
+        def write_events():
+            ae = scrape.write_events_as_json(unique)
+            for _ in output.iter_json_array(ae, True):
+                pass
+
+        record(results, "pipeline.append_city.%d" % size, timed(append_city))
+        record(results, "pipeline.append_city_cold.%d" % size, timed(append_city_cold))
+        record(results, "pipeline.remove_duplicates.%d" % size, timed(dedup))
+        record(results, "pipeline.write_events_as_json.%d" % size, timed(write_events))
+    return []
+
+
+# Number of events of the synthetic pages parsed entirely and partially, see
+# check_partial_parsing().
+PARTIAL_PARSING_SIZE = 300
+
+# Pages scraped from their DOM, as (platform, page generator, calendar URL).
+DOM_CALENDARS = (
+    ("BilletWeb", synthetic_BilletWeb, "https://www.billetweb.fr/multi_event.php"),
+    (
+        "BilletWebShop",
+        synthetic_BilletWebShop,
+        "https://www.billetweb.fr/shop.php?id=1",
+    ),
+    ("EventBrite", synthetic_EventBriteCards, "https://www.eventbrite.ch/o/synthetic"),
+    (
+        "FresqueDuClimat",
+        synthetic_FresqueDuClimat,
+        "https://association.climatefresk.org/training_sessions/",
+    ),
+)
+
+# Tree builders the pages are parsed with. lxml is optional.
+HTML_PARSERS = ("html.parser", "lxml")
+
+
+# Checks that the scrapers extract the same events from the subtrees built by
+# scrape.parse_page() as from the whole page, with each tree builder, and times both.
+# Returns the pages where the events differ, or where no event is found.
+def check_partial_parsing(results, sizes):
+    from bs4 import BeautifulSoup, FeatureNotFound
+
+    problems = []
+    pages = []
+    for page, url in TESTDATA_PAGES:
+        with open(os.path.join(SCRAPER_DIR, "testdata", page), encoding="utf-8") as f:
+            pages.append((page, f.read(), url, False))
+    for platform, generate, url in DOM_CALENDARS:
+        pages.append((platform, generate(PARTIAL_PARSING_SIZE), url, True))
+    for html_parser in HTML_PARSERS:
+        try:
+            BeautifulSoup("", html_parser)
+        except FeatureNotFound:
+            print(html_parser, "is not installed, not checking it")
+            continue
+        for name, text, url, has_events in pages:
+            events = dict()
+            for parsing, parse in (
+                ("full", lambda: BeautifulSoup(text, html_parser)),
+                ("partial", lambda: scrape.parse_page(text, url, html_parser)),
+            ):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    events[parsing] = scrape.scrape_soup(parse(), url, name, "fr")
+                record(
+                    results,
+                    "parse.%s.%s.%s" % (parsing, html_parser, name),
+                    timed(parse),
+                )
+            if events["full"] != events["partial"]:
+                problems.append(
+                    "partial parsing changes the events of %s with %s"
+                    % (name, html_parser)
+                )
+            elif has_events and not events["full"]:
+                problems.append("no event found in %s with %s" % (name, html_parser))
+    return problems
+
+
+# Checks that the fast extractors find the events of the testdata pages, and that an
+# EventBrite page whose server data has no event is scraped from its rendered cards.
+# Then compares the fast extractors with the DOM scrapers on synthetic pages of each size.
+# Returns the pages where the events are not found, and the sizes where the fast path is
+# not faster.
+def check_fast_extractors(results, sizes):
+    problems = []
+    for page, url, count in TESTDATA_FAST_EVENTS:
+        with open(os.path.join(SCRAPER_DIR, "testdata", page), "rb") as f:
+            data = f.read()
+        with contextlib.redirect_stdout(io.StringIO()):
+            events = scrape.fast_extractor(url)(data, url, page, "fr")
+        if events is None or len(events) != count:
+            problems.append(
+                "the fast extractor finds %s events in %s instead of %d"
+                % (None if events is None else len(events), page, count)
+            )
+
+    url = "https://www.eventbrite.ch/o/synthetic"
+    text = synthetic_EventBriteCards(3).replace(
+        "<body>", '<body><script>window.__SERVER_DATA__ = {"view_data": {}};</script>'
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "EventBrite.html.gz")
+        scrape.write_cache(filename, scrape.trim_page(text, url))
+        with contextlib.redirect_stdout(io.StringIO()):
+            events = scrape.extract_events(
+                filename, url, "EventBrite", "fr", "html.parser"
+            )
+        if len(events) != 3:
+            problems.append(
+                "%d events found in an EventBrite page without events in its server data"
+                " instead of 3" % len(events)
+            )
+
+    url = "https://www.billetweb.fr/shop.php?id=1"
+    for size in sizes:
+        text = synthetic_BilletWebShop(size)
+        data = text.encode("utf-8")
+
+        def fast():
+            scrape.fast_BilletWebShop(data, url, "Shop", "fr")
+
+        def dom():
+            soup = scrape.parse_page(io.StringIO(text), url, "html.parser")
+            scrape.scrape_BilletWebShop(soup, "Shop", url, "fr")
+
+        fast_seconds = timed(fast)
+        dom_seconds = timed(dom)
+        record(results, "fast.BilletWebShop.%d" % size, fast_seconds)
+        record(results, "dom.BilletWebShop.%d" % size, dom_seconds)
+        if fast_seconds >= dom_seconds:
+            problems.append(
+                "the fast BilletWeb shop extractor is not faster than the DOM with %d events"
+                % size
+            )
+    return problems
+
+
+# Checks that the pages parsed from their DOM in worker processes, as with --parse_workers,
+# give the same events as when they are parsed in-process, with each tree builder, and
+# times the pool. Returns the pages whose events differ or can't be sent back.
+def check_parse_workers(results, sizes):
+    from bs4 import BeautifulSoup, FeatureNotFound
+
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        # Copied, as scrape_calendar() writes the events it extracts next to the page.
+        pages = []
+        for page, url in TESTDATA_PAGES:
+            filename = os.path.join(directory, page)
+            shutil.copy(os.path.join(SCRAPER_DIR, "testdata", page), filename)
+            pages.append((page, filename, url))
+        for platform, generate, url in DOM_CALENDARS:
+            filename = os.path.join(directory, platform + ".html")
+            with open(filename, "w") as f:
+                f.write(generate(PARTIAL_PARSING_SIZE))
+            pages.append((platform, filename, url))
+        for html_parser in HTML_PARSERS:
+            try:
+                BeautifulSoup("", html_parser)
+            except FeatureNotFound:
+                print(html_parser, "is not installed, not checking it")
+                continue
+            for _, filename, _ in pages:
+                if os.path.exists(scrape.parsed_events_filename(filename)):
+                    os.remove(scrape.parsed_events_filename(filename))
+            start = time.perf_counter()
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=2, mp_context=multiprocessing.get_context("spawn")
+            ) as pool:
+                futures = [
+                    pool.submit(
+                        scrape.scrape_calendar, filename, url, name, "fr", html_parser
+                    )
+                    for name, filename, url in pages
+                ]
+                for (name, filename, url), future in zip(pages, futures):
+                    try:
+                        events, _ = future.result()
+                    except Exception as e:
+                        problems.append(
+                            "%s can't be parsed in a worker with %s: %r"
+                            % (name, html_parser, e)
+                        )
+                        continue
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        expected = scrape.extract_events(
+                            filename, url, name, "fr", html_parser
+                        )
+                    if events != expected:
+                        problems.append(
+                            "parsing %s in a worker changes its events with %s"
+                            % (name, html_parser)
+                        )
+            record(results, "parse_workers." + html_parser, time.perf_counter() - start)
+    return problems
+
+
+# Rows of the main spreadsheet served by the sheets.LocalService of check_sheets().
+LOCAL_SPREADSHEET = {
+    sheets.WORKSHOPS_RANGE: [
+        ["TRUE", "Fresque du Climat", "fr", "https://www.billetweb.fr/c1", "https://a"],
+        ["FALSE", "Fresque disabled", "fr", "https://www.billetweb.fr/c2", "https://b"],
+        ["TRUE", "Climate Fresk", "en", "https://www.billetweb.fr/c3", "https://c"],
+    ],
+    sheets.language_strings_range(*scrape.MAIN_PAGE_STRINGS): [
+        ["id", "en", "fr", "de"],
+        ["MainTitle", "Workshops", "Ateliers", "Workshops"],
+    ],
+    sheets.language_strings_range(*scrape.ABOUT_PAGE_STRINGS): [
+        ["id", "en", "fr"],
+        ["mainTitle", "About", "A propos"],
+    ],
+}
+
+
+# Checks that the calendars and the strings of the pages are read from the spreadsheet
+# with a single batchGet call, and that the next client reuses the snapshot of the values.
+# Returns what differs.
+def check_sheets(results, sizes):
+    problems = []
+    args = argparse.Namespace(main_html="index.html", about_prefix="about")
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_file = os.path.join(directory, "snapshot.json")
+        try:
+            for run, expected_calls in (("first", 1), ("second", 0)):
+                service = sheets.LocalService(
+                    {sheets.SAMPLE_SPREADSHEET_ID: LOCAL_SPREADSHEET}
+                )
+                sheets.set_client(sheets.SheetsClient(service, snapshot_file))
+                calendars = scrape.read_calendars(args)
+                strings = sheets.get_language_strings(*scrape.MAIN_PAGE_STRINGS)
+                strings += sheets.get_language_strings(*scrape.ABOUT_PAGE_STRINGS)
+                if [c[0] for c in calendars] != ["Climate Fresk", "Fresque du Climat"]:
+                    problems.append(
+                        "the %s run read the calendars %s" % (run, calendars)
+                    )
+                if len(strings) != 2:
+                    problems.append("the %s run read the strings %s" % (run, strings))
+                if service.calls != expected_calls:
+                    problems.append(
+                        "the %s run called the Sheets API %d times instead of %d"
+                        % (run, service.calls, expected_calls)
+                    )
+        finally:
+            sheets.set_client(None)
+    return problems
+
+
+# Number of events of the exports pushed by check_odoo().
+ODOO_EVENTS = 250
+
+
+# Returns the Odoo import rows of "n" synthetic events, by id.
+def synthetic_odoo_rows(n):
+    rows = dict()
+    for date, place, url in synthetic_events(n):
+        id = "fzc_fresque_%s_%s" % (date.strftime("%Y%m%d1830"), url.rsplit("/", 1)[1])
+        rows[id] = [
+            id,
+            date.strftime("%Y-%m-%d 18:30:00"),
+            date.strftime("%Y-%m-%d 21:30:00"),
+            place,
+            "Jeffrey Belt",
+            "Annoncé",
+            "Fresque du Climat",
+            url,
+            "Fresque",
+        ]
+    return rows
+
+
+# Pushes a full export, then the changes of a second one, to an odoo.FakeOdooServer, and
+# checks the batches and the records of the server, timing the first push.
+# Returns what differs.
+def check_odoo(results, sizes):
+    problems = []
+    fields = convert.COLUMNS + [convert.ACTIVE_COLUMN]
+    first = synthetic_odoo_rows(ODOO_EVENTS)
+    second = dict(list(first.items())[10:])  # 10 removed
+    for row in list(second.values())[:5]:
+        second[row[0]] = row[:6] + ["Fresque du Climat (complet)"] + row[7:]
+    for id, row in synthetic_odoo_rows(ODOO_EVENTS + 20).items():
+        if id not in first:
+            second[id] = row  # 20 created
+    server = odoo.FakeOdooServer()
+    try:
+        client = odoo.OdooClient(server.url, "db", "user", "password")
+        try:
+            for previous, current, expected in (
+                (dict(), first, (ODOO_EVENTS, 0, 0)),
+                (first, second, (20, 5, 10)),
+            ):
+                diff = convert.diff_exports(previous, current)
+                if tuple(map(len, diff)) != expected:
+                    problems.append(
+                        "the export diff has %s (created, changed, removed) rows"
+                        " instead of %s" % (tuple(map(len, diff)), expected)
+                    )
+                changes = convert.changes_rows(*diff)
+                del server.calls[:]
+                start = time.perf_counter()
+                client.load(odoo.EVENT_MODEL, fields, changes)
+                if not previous:
+                    record(
+                        results,
+                        "odoo.push.%d" % ODOO_EVENTS,
+                        time.perf_counter() - start,
+                    )
+                batches = [rows for _, _, rows in server.calls]
+                if (
+                    len(batches) != math.ceil(len(changes) / odoo.BATCH_SIZE)
+                    or max(batches) > odoo.BATCH_SIZE
+                ):
+                    problems.append(
+                        "%d changes were pushed in batches of %s"
+                        % (len(changes), batches)
+                    )
+        finally:
+            client.close()
+    finally:
+        server.close()
+    records = server.records.get(odoo.EVENT_MODEL, dict())
+    archived = [id for id, r in records.items() if r[convert.ACTIVE_COLUMN] == "False"]
+    renamed = [id for id, r in records.items() if r["name"].endswith("(complet)")]
+    if (len(records), len(archived), len(renamed)) != (ODOO_EVENTS + 20, 10, 5):
+        problems.append(
+            "the Odoo server has %d events, %d archived and %d changed instead of %d, 10"
+            " and 5" % (len(records), len(archived), len(renamed), ODOO_EVENTS + 20)
+        )
+    return problems
+
+
+# (calendar, place, city the event gets, None if it is skipped, or "raise" if the place of
+# such a calendar must be in a known Swiss city).
+LOCATION_CASES = (
+    ("Fresque du Climat", "Impact Hub, Av. de Sévelin 52, 1004 Lausanne", "Lausanne"),
+    (
+        "Fresque du Climat",
+        "Espace de coworking SEV52 - Avenue de Sévelin, 52",
+        "Lausanne",
+    ),
+    ("Fresque du Climat", "Rue Royale 1, 1000 Bruxelles, Belgique", None),
+    ("Climate Fresk", "Place du Marché 2, 4000 Liège, BELGIQUE", None),
+    ("Fresque de la Biodiversité", "Rue de la Paix 10, 75002 Paris", None),
+    ("Fresque du Climat", "Rue de la Paix 10, 75002 Paris", "raise"),
+)
+
+
+# Checks that the events of LOCATION_CASES get their city or are skipped, with a new
+# resolver and with one reading the resolutions saved by the first.
+# Returns the events that are not.
+def check_locations(results, sizes):
+    problems = []
+    today = datetime.date.today()
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "locations_cache.json")
+        for run in ("new", "saved"):
+            resolver = cities.LocationResolver(
+                cities.load_gazetteer(), cities.load_overrides(), filename
+            )
+            for calendar, place, expected in LOCATION_CASES:
+                event = sheets.Event(
+                    calendar, today, place, "https://example.org", "fr"
+                )
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        events = list(
+                            scrape.append_city_and_filter_for_switzerland(
+                                [event], False, resolver
+                            )
+                        )
+                    city = events[0].city if events else None
+                except Exception:
+                    city = "raise"
+                if city != expected:
+                    problems.append(
+                        "%s at %s: %s instead of %s with a %s resolver"
+                        % (calendar, place, city, expected, run)
+                    )
+            resolver.save()
+    return problems
+
+
+BENCHMARKS = {
+    "startup": check_startup,
+    "scrapers": check_scrapers,
+    "pipeline": check_pipeline,
+    "fast_extractors": check_fast_extractors,
+    "partial_parsing": check_partial_parsing,
+    "parse_workers": check_parse_workers,
+    "sheets": check_sheets,
+    "odoo": check_odoo,
+    "locations": check_locations,
+}
+
+
+# Returns the timings of "results" that regressed from "baseline" (both {name: seconds}).
+def compare(results, baseline):
+    problems = []
+    for name, seconds in sorted(results.items()):
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if (
+            seconds > base * REGRESSION_FACTOR
+            and seconds - base > REGRESSION_MIN_SECONDS
+        ):
+            problems.append(
+                "%s took %.1f ms, the baseline is %.1f ms"
+                % (name, seconds * 1000, base * 1000)
+            )
+    return problems
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help="Benchmarks to run among "
+        + ", ".join(BENCHMARKS.keys())
+        + ", all of them by default.",
+    )
+    argParser.add_argument(
+        "-s",
+        "--sizes",
+        default=",".join(map(str, SIZES)),
+        help="Comma-separated numbers of events of the synthetic calendars, e.g. 10000,100000.",
+    )
+    argParser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="JSON file where to write the timings, e.g. to use them as a baseline.",
+    )
+    argParser.add_argument(
+        "-b",
+        "--baseline",
+        default=None,
+        help="JSON file written by --output to compare the timings against.",
+    )
+    args = argParser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            argParser.error("unknown benchmark: " + name)
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    problems = []
+    results = dict()
+    for name in args.benchmarks or BENCHMARKS.keys():
+        problems.extend(BENCHMARKS[name](results, sizes))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"python": sys.version.split()[0], "sizes": sizes, "results": results},
+                f,
+                indent=4,
+            )
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems.extend(compare(results, json.load(f)["results"]))
+    for problem in problems:
+        print("FAILED:", problem)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import csv
+import functools
+import hashlib
+import json
+import os
+import re
+
+import output
+
+# The list of known Swiss cities, with their linguistic region.
+# Cities are matched in the order of the file, so put more specific names first.
+DEFAULT_CITIES_FILE = os.path.join(os.path.dirname(__file__), "cities.csv")
+
+# Region of cities that are not in the list.
+DEFAULT_LREGION = "Romandie"
+
+# Places the gazetteer gets wrong: places containing "location" (compared normalized) are
+# in "city", or not in Switzerland if "city" is empty. They are checked in the order of
+# the file, before the gazetteer.
+DEFAULT_OVERRIDES_FILE = os.path.join(
+    os.path.dirname(__file__), "location_overrides.csv"
+)
+
+# Places ending with one of these (compared normalized) are known not to be in
+# Switzerland, and are skipped without looking for a city.
+ABROAD_SUFFIXES = ("BELGIQUE",)
+
+# Where a place is, see LocationResolver.resolve(): in Switzerland, known not to be in
+# Switzerland (see ABROAD_SUFFIXES and the overrides), or in no known city.
+IN_SWITZERLAND = "switzerland"
+ABROAD = "abroad"
+UNKNOWN = "unknown"
+
+# Bump when the resolution of places changes, so that older resolutions are not reused.
+RESOLVER_VERSION = 2
+
+_normalizer = str.maketrans("ÜÈÂ", "UEA")
+
+
+# Returns the string used to match places against city names.
+def normalize(s):
+    return s.upper().translate(_normalizer)
+
+
+# Matches places against all the known cities with a single regular expression.
+class Gazetteer:
+    # rows: iterable of (city, linguistic region), in matching order.
+    def __init__(self, rows):
+        self.cities = []
+        self.lregions = dict()
+        for city, lregion in rows:
+            self.cities.append(city)
+            self.lregions[city] = lregion
+        self.indices = dict()
+        for i, city in enumerate(self.cities):
+            self.indices.setdefault(normalize(city), i)
+        # A city matches at the start of the place or after "(", " " or ",".
+        # The lookahead yields every such position, and at each of them the alternation
+        # picks the first city in list order.
+        self.pattern = re.compile(
+            r"(?:^|(?<=[( ,]))(?=("
+            + "|".join(re.escape(c) for c in self.indices.keys())
+            + "))"
+        )
+
+    # Returns the first city of the list found in "place", or None.
+    # Places in France are never matched.
+    def find_city(self, place):
+        normalized_place = normalize(place)
+        if "FRANCE" in normalized_place:
+            return None
+        best = None
+        for match in self.pattern.finditer(normalized_place):
+            i = self.indices[match.group(1)]
+            if best is None or i < best:
+                best = i
+        if best is None:
+            return None
+        return self.cities[best]
+
+    # Returns the linguistic region of a city.
+    def lregion(self, city):
+        return self.lregions.get(city, DEFAULT_LREGION)
+
+
+# Returns the gazetteer read from a CSV file with "city" and "lregion" columns.
+# It is built once per process.
+@functools.lru_cache(maxsize=None)
+def load_gazetteer(filename=DEFAULT_CITIES_FILE):
+    with open(filename, encoding="utf-8", newline="") as f:
+        return Gazetteer((row["city"], row["lregion"]) for row in csv.DictReader(f))
+
+
+# Returns the overrides read from a CSV file with "location" and "city" columns, as a list
+# of (normalized location, city or None).
+@functools.lru_cache(maxsize=None)
+def load_overrides(filename=DEFAULT_OVERRIDES_FILE):
+    with open(filename, encoding="utf-8", newline="") as f:
+        return [
+            (normalize(row["location"]), row["city"] or None)
+            for row in csv.DictReader(f)
+        ]
+
+
+# Resolves places to their city, remembering the resolution of each normalized place so
+# that places repeated across events and runs take a single lookup.
+# If "filename" is given, the resolutions are kept in that JSON file between runs, along
+# with a hash of the gazetteer and overrides they come from: they are dropped when these
+# change.
+class LocationResolver:
+    def __init__(self, gazetteer, overrides, filename=None):
+        self.gazetteer = gazetteer
+        self.overrides = overrides
+        self.filename = filename
+        key = json.dumps(
+            [RESOLVER_VERSION, gazetteer.cities, gazetteer.lregions, overrides]
+        )
+        self.key = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        self.locations = self._load()  # normalized place -> [city, lregion, where]
+        self.places = dict()  # place -> resolve(place), since the last save
+
+    def _load(self):
+        if not self.filename:
+            return dict()
+        try:
+            with open(self.filename, encoding="utf-8") as f:
+                table = json.load(f)
+        except (OSError, ValueError):
+            return dict()
+        if table.get("key") != self.key:
+            return dict()
+        return table["locations"]
+
+    # Returns (city, linguistic region, where): "where" is IN_SWITZERLAND, ABROAD or
+    # UNKNOWN, and the city and region are None for places outside of Switzerland.
+    def resolve(self, place):
+        resolved = self.places.get(place)
+        if resolved is not None:
+            return resolved
+        normalized_place = normalize(place)
+        if normalized_place not in self.locations:
+            city, where = self._locate(normalized_place)
+            lregion = self.gazetteer.lregion(city) if city else None
+            self.locations[normalized_place] = [city, lregion, where]
+        resolved = tuple(self.locations[normalized_place])
+        self.places[place] = resolved
+        return resolved
+
+    # Returns (city or None, where) for a normalized place.
+    def _locate(self, normalized_place):
+        if normalized_place.endswith(ABROAD_SUFFIXES):
+            return None, ABROAD
+        for location, city in self.overrides:
+            if location in normalized_place:
+                return (city, IN_SWITZERLAND) if city else (None, ABROAD)
+        city = self.gazetteer.find_city(normalized_place)
+        return (city, IN_SWITZERLAND) if city else (None, UNKNOWN)
+
+    # Writes the resolutions of the places resolved since the last save, so that the file
+    # only keeps the places of current events.
+    def save(self):
+        if not self.filename:
+            return
+        places = sorted(set(normalize(place) for place in self.places))
+        locations = {p: self.locations[p] for p in places}
+        self.places = dict()
+        with open(output.temporary_filename(self.filename), "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "locations": locations}, f, ensure_ascii=False)
+        output.publish(self.filename, False)
+
+
+# Returns the resolver of places to cities, using the default gazetteer and overrides and
+# keeping its resolutions in "filename" if given. It is built once per process and file.
+@functools.lru_cache(maxsize=None)
+def load_resolver(filename=None):
+    return LocationResolver(load_gazetteer(), load_overrides(), filename)
@@ -1,10 +1,150 @@
 import sheets
-from jinja2 import Environment, PackageLoader, select_autoescape
+import argparse
 import csv
 import datetime
+import math
+import os
+
+import odoo
+
+# Columns of the Odoo import file, "id" being the external identifier of the event.
+COLUMNS = [
+    "id",
+    "date_begin",
+    "date_end",
+    "address_id",
+    "user_id",
+    "stage_id",
+    "name",
+    "description",
+    "tag_ids",
+]
+
+# The changes file has this extra column, so that importing it also archives the events
+# removed since the previous export.
+ACTIVE_COLUMN = "active"
+
+
+# Returns the Odoo import row of a manual event.
+def event_to_row(event, description_template):
+    organizer_name = "One Planet Friends"
+    organizer_url = "http://oneplanetfriends.org/"
+    address_id = event.location
+
+    if event.organizer == "OPF":
+        if event.location == "WWF Schweiz, Hohlstrasse 110, 8004 Zürich":
+            address_id = "WWF Schweiz"
+        if event.location == "Impact Hub Zürich - Colab, Sihlquai 131, 8005 Zürich":
+            address_id = "Impact Hub Zürich"
+
+    if event.organizer == "FZC":
+        organizer_name = "Fresques Zamies & Co"
+        organizer_url = "https://fresqueszamies.ch/"
+        if event.location == "Espace de coworking SEV52 - Avenue de Sévelin, 52":
+            address_id = "SEV52"
+        if event.location == "Impact Hub Lausanne, Av. Bergières 10":
+            address_id = "Impact Hub Lausanne"
+
+    # TODO: start and end times should be parsed from the event
+    date_start = datetime.datetime(
+        event.date.year, event.date.month, event.date.day, 18, 30
+    )
+    date_end = datetime.datetime(
+        event.date.year, event.date.month, event.date.day, 21, 30
+    )
+    return [
+        event.organizer.casefold()
+        + "_"
+        + event.name.casefold().translate(str.maketrans(" ", "_"))
+        + "_"
+        + event.date.strftime("%Y%m%d%H%M")
+        + "_"
+        + event.language,
+        date_start.strftime("%Y-%m-%d %H:%M:00"),
+        date_end.strftime("%Y-%m-%d %H:%M:00"),
+        address_id,
+        "Jeffrey Belt",
+        "Annoncé",
+        event.name,
+        "".join(
+            description_template.render(
+                {
+                    "organizer_name": organizer_name,
+                    "organizer_url": organizer_url,
+                    "event_url": event.url,
+                }
+            ).splitlines()
+        ),
+        "Fresque",
+    ]
+
+
+# Returns the rows of an export file by id, or no rows if it doesn't exist.
+def read_export(filename):
+    if not os.path.exists(filename):
+        return dict()
+    with open(filename, newline="") as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader, None)
+        if header != COLUMNS:
+            raise Exception("Unexpected columns in " + filename + ": " + str(header))
+        return {row[0]: row for row in reader}
+
+
+def write_export(filename, columns, rows):
+    with open(filename, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+# Compares the rows of two exports by id.
+# Returns the lists of (created, changed, removed) rows, removed rows as previously exported.
+def diff_exports(previous, current):
+    created = [row for id, row in current.items() if id not in previous]
+    changed = [
+        row for id, row in current.items() if id in previous and previous[id] != row
+    ]
+    removed = [row for id, row in previous.items() if id not in current]
+    return created, changed, removed
+
+
+# Returns the rows of the changes file: the created and changed rows, active, and the
+# removed ones, archived.
+def changes_rows(created, changed, removed):
+    return [row + ["True"] for row in created + changed] + [
+        row + ["False"] for row in removed
+    ]
 
 
 def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "-o",
+        "--output",
+        default="odoo.csv",
+        help="Odoo import file of all the events. Its previous version is what the changes are computed against.",
+    )
+    argParser.add_argument(
+        "-c",
+        "--changes",
+        default=None,
+        help="Odoo import file of the events created, changed or removed (archived) since the previous export, disabled if left empty.",
+    )
+    argParser.add_argument(
+        "--odoo_url",
+        default=None,
+        help="URL of the Odoo server to push the changes to, disabled if left empty. The password is read from $ODOO_PASSWORD.",
+    )
+    argParser.add_argument("--odoo_db", default=None, help="Odoo database.")
+    argParser.add_argument("--odoo_user", default=None, help="Odoo user.")
+    argParser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Only print what would be pushed, without pushing it nor updating --output.",
+    )
+    args = argParser.parse_args()
+
     events = []
     for organizer in ["FZC"]:
         events.extend(
@@ -34,86 +174,58 @@ def main():
         )
     )
 
+    from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
+
     env = Environment(
         loader=PackageLoader("convert"),
         autoescape=False,  # TODO: replace with select_autoescape()
+        bytecode_cache=FileSystemBytecodeCache(),
     )
     description_template = env.get_template("odoo.html")
 
-    with open("odoo.csv", "w", newline="") as csvfile:
-        writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
-        writer.writerow(
-            [
-                "id",
-                "date_begin",
-                "date_end",
-                "address_id",
-                "user_id",
-                "stage_id",
-                "name",
-                "description",
-                "tag_ids",
-            ]
+    current = dict()
+    for event in events:
+        row = event_to_row(event, description_template)
+        current[row[0]] = row
+    previous = read_export(args.output)
+    created, changed, removed = diff_exports(previous, current)
+    print(
+        len(created),
+        "created,",
+        len(changed),
+        "changed,",
+        len(removed),
+        "removed event(s)",
+    )
+    changes = changes_rows(created, changed, removed)
+
+    if args.changes:
+        write_export(args.changes, COLUMNS + [ACTIVE_COLUMN], changes)
+
+    if args.dry_run:
+        # The export is what the next run diffs against, so it is left as is.
+        calls = math.ceil(len(changes) / odoo.BATCH_SIZE)
+        print("Would push", len(changes), "event(s) to Odoo in", calls, "call(s)")
+        return
+
+    if changes and args.odoo_url:
+        client = odoo.OdooClient(
+            args.odoo_url,
+            args.odoo_db,
+            args.odoo_user,
+            os.environ.get("ODOO_PASSWORD", ""),
         )
-        for event in events:
-            organizer_name = "One Planet Friends"
-            organizer_url = "http://oneplanetfriends.org/"
-            address_id = event.location
-
-            if event.organizer == "OPF":
-                if event.location == "WWF Schweiz, Hohlstrasse 110, 8004 Zürich":
-                    address_id = "WWF Schweiz"
-                if (
-                    event.location
-                    == "Impact Hub Zürich - Colab, Sihlquai 131, 8005 Zürich"
-                ):
-                    address_id = "Impact Hub Zürich"
-
-            if event.organizer == "FZC":
-                organizer_name = "Fresques Zamies & Co"
-                organizer_url = "https://fresqueszamies.ch/"
-                if (
-                    event.location
-                    == "Espace de coworking SEV52 - Avenue de Sévelin, 52"
-                ):
-                    address_id = "SEV52"
-                if event.location == "Impact Hub Lausanne, Av. Bergières 10":
-                    address_id = "Impact Hub Lausanne"
-
-            # TODO: start and end times should be parsed from the event
-            date_start = datetime.datetime(
-                event.date.year, event.date.month, event.date.day, 18, 30
-            )
-            date_end = datetime.datetime(
-                event.date.year, event.date.month, event.date.day, 21, 30
-            )
-            writer.writerow(
-                [
-                    event.organizer.casefold()
-                    + "_"
-                    + event.name.casefold().translate(str.maketrans(" ", "_"))
-                    + "_"
-                    + event.date.strftime("%Y%m%d%H%M")
-                    + "_"
-                    + event.language,
-                    date_start.strftime("%Y-%m-%d %H:%M:00"),
-                    date_end.strftime("%Y-%m-%d %H:%M:00"),
-                    address_id,
-                    "Jeffrey Belt",
-                    "Annoncé",
-                    event.name,
-                    "".join(
-                        description_template.render(
-                            {
-                                "organizer_name": organizer_name,
-                                "organizer_url": organizer_url,
-                                "event_url": event.url,
-                            }
-                        ).splitlines()
-                    ),
-                    "Fresque",
-                ]
+        try:
+            client.load(odoo.EVENT_MODEL, COLUMNS + [ACTIVE_COLUMN], changes)
+            print(
+                "Pushed", len(changes), "event(s) to Odoo in", client.calls, "call(s)"
             )
+        finally:
+            client.close()
+
+    # Only record the export once the changes are pushed, so that failed pushes are
+    # retried on the next run.
+    write_export(args.output, COLUMNS, current.values())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+import datetime
+import functools
+
+# Platforms with their own date formats.
+PLATFORM_BILLETWEB = "billetweb"
+PLATFORM_CLIMATEFRESK = "climatefresk"
+PLATFORM_EVENTBRITE = "eventbrite"
+PLATFORM_WATTED = "watted"
+
+# strptime patterns tried before falling back to dateparser, as
+# (format, number of leading characters to parse or None for the whole string).
+FAST_PATTERNS = {
+    PLATFORM_BILLETWEB: (
+        ("%a %m/%d", None),  # ex: Sun 03/25
+        ("%a %b %d, %Y", 16),  # ex: Sun Mar 03, 2023
+    ),
+    PLATFORM_EVENTBRITE: (("%a, %b %d", 11),),  # ex: Tue, Mar 21
+}
+
+# dateparser settings per platform, None if dateparser must not be used.
+DATEPARSER_SETTINGS = {
+    PLATFORM_BILLETWEB: {
+        "DATE_ORDER": "DMY",
+        "REQUIRE_PARTS": ["day", "month"],
+        "SKIP_TOKENS": ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"],
+    },
+    PLATFORM_CLIMATEFRESK: {},
+    PLATFORM_EVENTBRITE: None,
+    PLATFORM_WATTED: {},
+}
+
+CACHE_SIZE = 4096
+
+# How many strings were parsed by a strptime pattern, by dateparser, or not at all.
+# Cache hits are not counted here, see get_stats().
+_counters = {"fast_path": 0, "dateparser": 0, "unparsable": 0}
+
+
+# Returns a Date object (at midnight) for the given strptime format, or None on failure.
+# If the year is not parsed (1900), it's set to the current year.
+# https://docs.python.org/3/library/datetime.html#strftime-strptime-behavior
+def maybeParseDate(date_string, format):
+    try:
+        dt = datetime.datetime.strptime(date_string, format)
+        date = dt.date()
+        if date.year == 1900:
+            return datetime.date(datetime.datetime.today().year, date.month, date.day)
+        return date
+    except ValueError:
+        return None
+
+
+# Returns the date in "date_string" as written on the given platform, or None.
+# Results are memoized, so that the dates repeated across events are only parsed once.
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_date(date_string, platform):
+    for format, length in FAST_PATTERNS.get(platform, ()):
+        date = maybeParseDate(date_string[0:length], format)
+        if date:
+            _counters["fast_path"] += 1
+            return date
+
+    settings = DATEPARSER_SETTINGS.get(platform, {})
+    if settings is not None:
+        import dateparser  # slow to import, only needed on a miss
+
+        dt = dateparser.parse(date_string, settings=settings)
+        if dt:
+            _counters["dateparser"] += 1
+            return dt.date()
+
+    _counters["unparsable"] += 1
+    return None
+
+
+# Returns the counters of the date parser, e.g. to check how often dateparser is used.
+def get_stats():
+    info = parse_date.cache_info()
+    stats = dict(_counters)
+    stats["cache_hits"] = info.hits
+    stats["cache_misses"] = info.misses
+    return stats
@@ -0,0 +1,118 @@
+import threading
+import time
+import urllib.parse
+
+# (connect, read) timeouts in seconds, applied to every request.
+TIMEOUT = (10, 60)
+
+# Failed requests are retried with an exponential backoff of BACKOFF_FACTOR * 2^n seconds.
+RETRIES = 3
+BACKOFF_FACTOR = 1
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Keep-alive connections kept per host.
+POOL_MAXSIZE = 4
+
+# Each domain gets a token bucket refilled at RATE requests per second, holding up to BURST.
+RATE = 1.0
+BURST = 2
+
+
+# Classic token bucket, shared by all the threads talking to the same domain.
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Blocks until a token is available, then takes it.
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets = dict()
+_buckets_lock = threading.Lock()
+
+
+# Blocks until a request to the domain of "url" is allowed by its rate limiter.
+def throttle(url):
+    throttle_domain(urllib.parse.urlsplit(url).hostname)
+
+
+def throttle_domain(domain):
+    with _buckets_lock:
+        bucket = _buckets.get(domain)
+        if bucket is None:
+            bucket = TokenBucket(RATE, BURST)
+            _buckets[domain] = bucket
+    bucket.acquire()
+
+
+# Mounts the pooled, retrying adapter on a requests session. Only GETs are retried, as
+# they are idempotent, and each retry also waits for the rate limiter of its domain.
+def configure_session(session):
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class ThrottledRetry(Retry):
+        domain = None
+
+        # urllib3 calls increment() with the connection pool of the failed request, then
+        # sleep() on the returned Retry before the next attempt.
+        def increment(self, *args, **kwargs):
+            retry = super().increment(*args, **kwargs)
+            pool = kwargs.get("_pool")
+            retry.domain = pool.host if pool is not None else self.domain
+            return retry
+
+        def sleep(self, response=None):
+            super().sleep(response)
+            if self.domain:
+                throttle_domain(self.domain)
+
+    retry = ThrottledRetry(
+        total=RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=["GET"],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Returns the process-wide session, so that connections are reused across calendars.
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests  # not needed when everything is cached
+
+            _session = configure_session(requests.Session())
+        return _session
+
+
+# GET "url" through the shared session, rate limited and with the default timeouts.
+def get(url, **kwargs):
+    throttle(url)
+    kwargs.setdefault("timeout", TIMEOUT)
+    return get_session().get(url, **kwargs)
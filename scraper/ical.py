@@ -0,0 +1,94 @@
+import datetime
+import re
+
+# Events starting more than this many days from today are skipped by default, see the
+# --ical_horizon flag of scrape.py.
+HORIZON_DAYS = 365
+
+_DATE = re.compile(r"(\d{4})(\d{2})(\d{2})")
+
+_UNESCAPE = re.compile(r"\\([\\;,nN])")
+
+
+# Yields the logical lines of an iCalendar file, joining folded lines (RFC 5545, 3.1).
+def unfold(fp):
+    current = None
+    for line in fp:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t"):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+# Splits a content line into (property name, value), ignoring the parameters.
+def split_property(line):
+    quoted = False
+    for i, c in enumerate(line):
+        if c == '"':
+            quoted = not quoted
+        elif c == ":" and not quoted:
+            return line[:i].split(";", 1)[0].upper(), line[i + 1 :]
+    return line.upper(), ""
+
+
+# Returns the value of a TEXT property without its escape sequences.
+def unescape(value):
+    return _UNESCAPE.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+# Returns the date of a DATE or DATE-TIME value as written, or None.
+def parse_date(value):
+    m = _DATE.match(value)
+    if not m:
+        return None
+    try:
+        return datetime.date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        return None
+
+
+# Reads the events of an iCalendar file, yielding for each VEVENT starting between "start"
+# and "end" (inclusive) a dictionary with its DTSTART date and the unescaped text of its
+# other properties. Events outside of the window are skipped as soon as their DTSTART is
+# read, so large calendars cost time proportional to their upcoming events.
+def read_events(fp, start, end):
+    event = None
+    skipping = False
+    depth = 0  # nested components like VALARM
+    for line in unfold(fp):
+        if event is None:
+            if line == "BEGIN:VEVENT":
+                event = dict()
+                skipping = False
+                depth = 0
+            continue
+        if line == "END:VEVENT" and depth == 0:
+            if not skipping and "DTSTART" in event:
+                yield event
+            event = None
+            continue
+        if skipping:
+            continue
+        if line.startswith("BEGIN:"):
+            depth += 1
+            continue
+        if line.startswith("END:"):
+            depth -= 1
+            continue
+        if depth > 0:
+            continue
+        name, value = split_property(line)
+        if name == "DTSTART":
+            date = parse_date(value)
+            if date is None or date < start or date > end:
+                skipping = True
+                continue
+            event[name] = date
+        elif name not in event:
+            event[name] = unescape(value)
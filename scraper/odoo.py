@@ -0,0 +1,96 @@
+import threading
+import xmlrpc.client
+
+# Odoo model of the events.
+EVENT_MODEL = "event.event"
+
+# Rows sent per load() call.
+BATCH_SIZE = 100
+
+
+# Client of the Odoo external API (XML-RPC). The object endpoint is used through a single
+# ServerProxy, whose transport keeps its HTTP connection open between calls.
+class OdooClient:
+    def __init__(self, url, db, username, password):
+        self.db = db
+        self.password = password
+        common = xmlrpc.client.ServerProxy(url + "/xmlrpc/2/common", allow_none=True)
+        self.uid = common.authenticate(db, username, password, {})
+        if not self.uid:
+            raise Exception("Odoo authentication failed for " + username)
+        self.models = xmlrpc.client.ServerProxy(
+            url + "/xmlrpc/2/object", allow_none=True
+        )
+        self.calls = 0
+
+    def execute_kw(self, model, method, args, kwargs=None):
+        self.calls += 1
+        return self.models.execute_kw(
+            self.db, self.uid, self.password, model, method, args, kwargs or {}
+        )
+
+    # Imports the rows (lists of strings, as in a CSV import) into "model" in batches of
+    # BATCH_SIZE. Like the CSV import, the "id" field is the external identifier: rows with
+    # a known one update their record, the others create one.
+    # Returns the number of rows imported.
+    def load(self, model, fields, rows):
+        for i in range(0, len(rows), BATCH_SIZE):
+            result = self.execute_kw(model, "load", [fields, rows[i : i + BATCH_SIZE]])
+            errors = [m for m in result["messages"] if m.get("type") == "error"]
+            if errors:
+                raise Exception("Odoo import failed: " + str(errors))
+        return len(rows)
+
+    def close(self):
+        self.models("close")()
+
+
+# In-memory stand-in for an Odoo server, only implementing what OdooClient uses: it stores
+# the loaded rows by external identifier and counts the calls. Serves on localhost, on a
+# free port unless one is given.
+class FakeOdooServer:
+    def __init__(self, port=0):
+        import xmlrpc.server  # slow to import, only needed to check what is pushed
+
+        self.records = dict()  # model -> {external id: {field: value}}
+        self.calls = []  # (model, method, number of rows)
+
+        class RequestHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
+            rpc_paths = ("/xmlrpc/2/common", "/xmlrpc/2/object")
+
+        self.server = xmlrpc.server.MultiPathXMLRPCServer(
+            ("127.0.0.1", port),
+            requestHandler=RequestHandler,
+            logRequests=False,
+            allow_none=True,
+        )
+        common = xmlrpc.server.SimpleXMLRPCDispatcher(allow_none=True)
+        common.register_function(self.authenticate, "authenticate")
+        objects = xmlrpc.server.SimpleXMLRPCDispatcher(allow_none=True)
+        objects.register_function(self.execute_kw, "execute_kw")
+        self.server.add_dispatcher("/xmlrpc/2/common", common)
+        self.server.add_dispatcher("/xmlrpc/2/object", objects)
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def authenticate(self, db, username, password, context):
+        return 1
+
+    def execute_kw(self, db, uid, password, model, method, args, kwargs):
+        if method != "load":
+            raise Exception("Method not implemented by the fake server: " + method)
+        fields, rows = args
+        self.calls.append((model, method, len(rows)))
+        records = self.records.setdefault(model, dict())
+        ids = []
+        for row in rows:
+            values = dict(zip(fields, row))
+            xml_id = values.pop("id")
+            records.setdefault(xml_id, dict()).update(values)
+            ids.append(list(records.keys()).index(xml_id) + 1)
+        return {"ids": ids, "messages": []}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
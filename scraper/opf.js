@@ -108,9 +108,6 @@ function displayDate(then, locale) {
 
 function injectTable(events, locale) {
     let t = "";
-    events.sort(function(a, b) {
-        return a.date - b.date;
-    });
     for (let x in events) {
         let event = events[x];
         workshopSuffix = "";
@@ -140,19 +137,232 @@ function injectTable(events, locale) {
     return t;
 }
 
+// When the events are split in shards (scrape.py --shards_dir), the page defines
+// eventsManifestUrl instead of loading events.js, and the shards of a region are only
+// downloaded the first time the region is selected.
+let eventsManifest = null;
+
+const loadedShards = new Map();
+
+let shardRequest = 0;
+
+function currentMonth() {
+    return nowDate.getFullYear() + "-" + String(nowDate.getMonth() + 1).padStart(2, "0");
+}
+
+function shardIsNeeded(shard, regions) {
+    if (!regions.has(shard.lregion)) {
+        return false;
+    }
+    return shard.month == null || shard.month >= currentMonth();
+}
+
+function loadShards(regions) {
+    if (eventsManifest === null) {
+        eventsManifest = fetch(eventsManifestUrl).then(function(response) {
+            return response.json();
+        });
+    }
+    const base = eventsManifestUrl.substring(0, eventsManifestUrl.lastIndexOf("/") + 1);
+    return eventsManifest.then(function(manifest) {
+        let files = [];
+        let pending = [];
+        for (const shard of manifest.shards) {
+            if (!shardIsNeeded(shard, regions)) {
+                continue;
+            }
+            if (!loadedShards.has(shard.file)) {
+                loadedShards.set(shard.file, fetch(base + shard.file).then(function(response) {
+                    return response.json();
+                }));
+            }
+            files.push(shard.file);
+            pending.push(loadedShards.get(shard.file));
+        }
+        return Promise.all(pending).then(function(shards) {
+            return {
+                files: files,
+                shards: shards
+            };
+        });
+    });
+}
+
+function byDate(a, b) {
+    return a.date - b.date;
+}
+
+// Builds the facet indexes of events sorted by date, like FacetIndexes in scrape.py:
+// for each filtered field, the indices of the events having each value, in increasing order.
+function buildFacets(events) {
+    let facets = {
+        lregion: {},
+        organizer: {},
+        language: {}
+    };
+    events.forEach(function(event, i) {
+        for (const field in facets) {
+            const key = String(event[field]);
+            if (!(key in facets[field])) {
+                facets[field][key] = [];
+            }
+            facets[field][key].push(i);
+        }
+    });
+    return facets;
+}
+
+// events.js ships the events sorted by date with their eventFacets; older files get them
+// computed once here.
+let eventIndex = null;
+
+function getEventIndex() {
+    if (eventIndex === null) {
+        if (typeof eventFacets === "undefined") {
+            events.sort(byDate);
+            eventIndex = {
+                events: events,
+                facets: buildFacets(events)
+            };
+        } else {
+            eventIndex = {
+                events: events,
+                facets: eventFacets
+            };
+        }
+    }
+    return eventIndex;
+}
+
+// The shards loaded for the current regions, merged and indexed once per set of shards.
+let shardIndex = {
+    files: null,
+    events: [],
+    facets: buildFacets([])
+};
+
+function indexShards(files, shards) {
+    const key = files.join("\n");
+    if (shardIndex.files !== key) {
+        const shardEvents = [].concat(...shards).sort(byDate);
+        shardIndex = {
+            files: key,
+            events: shardEvents,
+            facets: buildFacets(shardEvents)
+        };
+    }
+    return shardIndex;
+}
+
+// Returns the first position in the sorted array where value could be inserted.
+function lowerBound(array, value, valueOf) {
+    let low = 0;
+    let high = array.length;
+    while (low < high) {
+        const middle = (low + high) >>> 1;
+        if (valueOf(array[middle]) < value) {
+            low = middle + 1;
+        } else {
+            high = middle;
+        }
+    }
+    return low;
+}
+
+// Returns the sorted indices of the events having one of the values in the index.
+function facetUnion(index, values) {
+    let lists = [];
+    for (const value of values) {
+        const list = index[String(value)];
+        if (list !== undefined) {
+            lists.push(list);
+        }
+    }
+    if (lists.length == 1) {
+        return lists[0];
+    }
+    return [].concat(...lists).sort(function(a, b) {
+        return a - b;
+    });
+}
+
+// Returns the indices present in both sorted lists.
+function intersectSorted(a, b) {
+    let result = [];
+    let i = 0;
+    let j = 0;
+    while (i < a.length && j < b.length) {
+        if (a[i] < b[j]) {
+            i++;
+        } else if (a[i] > b[j]) {
+            j++;
+        } else {
+            result.push(a[i]);
+            i++;
+            j++;
+        }
+    }
+    return result;
+}
+
+// Returns the future events of the index matching the filters, sorted by date.
+function selectEvents(index, regions, organizers) {
+    let selected = facetUnion(index.facets.lregion, [ "Both", ...regions ]);
+    if (organizers != null && organizers.size > 0) {
+        selected = intersectSorted(selected, facetUnion(index.facets.organizer, organizers));
+    }
+    const firstFuture = lowerBound(index.events, today, function(event) {
+        return event.date * 1e3;
+    });
+    const start = lowerBound(selected, firstFuture, function(i) {
+        return i;
+    });
+    return selected.slice(start).map(function(i) {
+        return index.events[i];
+    });
+}
+
+// Merges two lists of events sorted by date.
+function mergeByDate(a, b) {
+    let result = [];
+    let i = 0;
+    let j = 0;
+    while (i < a.length || j < b.length) {
+        if (j == b.length || i < a.length && a[i].date <= b[j].date) {
+            result.push(a[i++]);
+        } else {
+            result.push(b[j++]);
+        }
+    }
+    return result;
+}
+
 function rebuildEventTable(regions, locale, organizers) {
+    if (typeof eventsManifestUrl === "undefined") {
+        injectEventTable(getEventIndex(), regions, locale, organizers);
+        return;
+    }
+    const request = ++shardRequest;
+    loadShards(regions).then(function(loaded) {
+        if (request == shardRequest) {
+            injectEventTable(indexShards(loaded.files, loaded.shards), regions, locale, organizers);
+        }
+    });
+}
+
+function injectEventTable(index, regions, locale, organizers) {
+    // The few manually entered events are not indexed.
     function eventIsInTheFuture(event) {
         return event.date * 1e3 >= today;
     }
-    let filtered = events.concat(trix).filter(eventIsInTheFuture);
     function organizerIsAllowed(event) {
         return organizers == null || organizers.size == 0 || organizers.has(event.organizer);
     }
-    filtered = filtered.filter(organizerIsAllowed);
     function regionIsAllowed(event) {
         return event.lregion == "Both" || regions.has(event.lregion);
     }
-    filtered = filtered.filter(regionIsAllowed);
+    const manual = trix.filter(eventIsInTheFuture).filter(organizerIsAllowed).filter(regionIsAllowed).sort(byDate);
+    const filtered = mergeByDate(selectEvents(index, regions, organizers), manual);
     document.getElementById("event_container").innerHTML = injectTable(filtered, locale);
 }
 
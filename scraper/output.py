@@ -0,0 +1,163 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+# Versioned copies of a file are named after it with the first VERSION_LENGTH hex digits of
+# the sha256 of their content before the extension, e.g. "events.0123456789ab.js".
+VERSION_LENGTH = 12
+
+# Superseded versions are kept this many seconds, for the pages still referencing them.
+VERSION_RETENTION = 24 * 3600
+
+_VERSION = re.compile(r"\.[0-9a-f]{%d}(\.[^./]+)$" % VERSION_LENGTH)
+
+# Suffixes of the compressed variants of a file, see write_compressed_variants().
+COMPRESSED_SUFFIXES = [".gz", ".br"]
+
+
+# Writes "<filename>.gz" and "<filename>.br" next to a generated file, so that the web
+# server can send them as is to the clients accepting them (see src/.htaccess). Each one
+# replaces the previous one at once, like publish().
+# The .br variant needs the optional brotli package; without it, a stale .br is removed
+# rather than served.
+def write_compressed_variants(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+    _replace(filename + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        print("brotli is not installed, not writing", filename + ".br")
+        if os.path.exists(filename + ".br"):
+            os.remove(filename + ".br")
+        return
+    _replace(filename + ".br", brotli.compress(data, quality=11))
+
+
+# Replaces "filename" by a file holding "data", through its temporary_filename().
+def _replace(filename, data):
+    with open(temporary_filename(filename), "wb") as f:
+        f.write(data)
+    os.replace(temporary_filename(filename), filename)
+
+
+# Returns the JSON text of a value of an array, preceded by its separator, formatted like
+# json.dumps(array, indent=4), or without whitespace if compact.
+def _json_array_value(value, first, compact):
+    if compact:
+        return ("" if first else ",") + json.dumps(value, separators=(",", ":"))
+    text = json.dumps(value, indent=4).replace("\n", "\n    ")
+    return ("\n    " if first else ",\n    ") + text
+
+
+def _json_array_end(empty, compact):
+    return "]" if empty or compact else "\n]"
+
+
+# Yields the JSON text of an array of "values" piece by piece, formatted like dump_json()
+# in scrape.py, so that large arrays can be written without being held in memory.
+def iter_json_array(values, compact):
+    yield "["
+    first = True
+    for value in values:
+        yield _json_array_value(value, first, compact)
+        first = False
+    yield _json_array_end(first, compact)
+
+
+# Writes the values of a JSON array to an open file one at a time, like iter_json_array().
+class JsonArrayWriter:
+    def __init__(self, f, compact):
+        self.f = f
+        self.compact = compact
+        self.count = 0
+        f.write("[")
+
+    def write(self, value):
+        self.f.write(_json_array_value(value, self.count == 0, self.compact))
+        self.count += 1
+
+    # Ends the array, leaving the file open.
+    def close(self):
+        self.f.write(_json_array_end(self.count == 0, self.compact))
+
+
+# Name under which a file is written before replacing the published one.
+def temporary_filename(filename):
+    return filename + ".tmp"
+
+
+# Returns the sha256 of the content of a file, in hex.
+def content_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# Replaces "filename" by its temporary_filename() version, and writes its compressed
+# variants if compact, or removes them otherwise. The rename is atomic, so readers see
+# either the old or the new file.
+# If the content didn't change, the published file is left untouched so that it keeps its
+# modification time, and the temporary file is deleted.
+# Returns whether the file was replaced.
+def publish(filename, compact):
+    temporary = temporary_filename(filename)
+    if os.path.exists(filename) and content_hash(temporary) == content_hash(filename):
+        os.remove(temporary)
+        if compact and not all(
+            os.path.exists(filename + suffix) for suffix in COMPRESSED_SUFFIXES
+        ):
+            write_compressed_variants(filename)
+        return False
+    os.replace(temporary, filename)
+    if compact:
+        write_compressed_variants(filename)
+    else:
+        # The web server would keep sending the variants of the previous content.
+        for suffix in COMPRESSED_SUFFIXES:
+            if os.path.exists(filename + suffix):
+                os.remove(filename + suffix)
+    return True
+
+
+# Returns the name of the version of "filename" whose content has the hash "digest".
+def versioned_filename(filename, digest):
+    root, extension = os.path.splitext(filename)
+    return root + "." + digest[:VERSION_LENGTH] + extension
+
+
+# Returns the name of the file "filename" is a version of, or None if it isn't one.
+def unversioned_filename(filename):
+    if _VERSION.search(filename) is None:
+        return None
+    return _VERSION.sub(r"\1", filename)
+
+
+# Copies a published file, along with its compressed variants, to its versioned_filename(),
+# which never changes and can be cached forever. The versions of the file superseded for
+# more than VERSION_RETENTION are deleted.
+# Returns the versioned filename.
+def publish_version(filename):
+    versioned = versioned_filename(filename, content_hash(filename))
+    for suffix in [""] + COMPRESSED_SUFFIXES:
+        if os.path.exists(filename + suffix) and not os.path.exists(versioned + suffix):
+            shutil.copyfile(filename + suffix, temporary_filename(versioned + suffix))
+            os.replace(temporary_filename(versioned + suffix), versioned + suffix)
+    # Record when the version became the current one, for the retention of the others.
+    os.utime(versioned)
+    directory = os.path.dirname(filename)
+    for name in os.listdir(directory or "."):
+        version = os.path.join(directory, name)
+        if version == versioned or unversioned_filename(version) != filename:
+            continue
+        if time.time() - os.path.getmtime(version) > VERSION_RETENTION:
+            for suffix in [""] + COMPRESSED_SUFFIXES:
+                if os.path.exists(version + suffix):
+                    os.remove(version + suffix)
+    return versioned
@@ -0,0 +1,103 @@
+import threading
+
+# Maximum number of pages rendered at the same time.
+MAX_TABS = 2
+
+# Seconds to wait for a page to load.
+TIMEOUT = 60
+
+# asyncio is imported by the methods, to keep it out of runs that render nothing.
+
+
+# A headless browser shared by all the pages that need JavaScript to be rendered.
+# The browser runs its own event loop on a background thread, so render() can be called
+# from any thread; it is launched on the first call and reused until close().
+class RenderWorker:
+    def __init__(self, max_tabs=MAX_TABS, timeout=TIMEOUT):
+        import asyncio
+
+        self.max_tabs = max_tabs
+        self.timeout = timeout
+        self.browser = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.launch_lock = None
+        self.tabs = None
+
+    async def _get_browser(self):
+        import asyncio
+
+        if self.launch_lock is None:
+            self.launch_lock = asyncio.Lock()
+            self.tabs = asyncio.Semaphore(self.max_tabs)
+        async with self.launch_lock:
+            if self.browser is None:
+                import pyppeteer  # only needed when a page must be rendered
+
+                # Signal handlers can only be installed from the main thread.
+                self.browser = await pyppeteer.launch(
+                    headless=True,
+                    args=["--no-sandbox"],
+                    handleSIGINT=False,
+                    handleSIGTERM=False,
+                    handleSIGHUP=False,
+                )
+        return self.browser
+
+    async def _render(self, url, selector):
+        browser = await self._get_browser()
+        async with self.tabs:
+            page = await browser.newPage()
+            try:
+                await page.goto(url, timeout=self.timeout * 1000)
+                if not selector:
+                    return await page.content()
+                element = await page.querySelector(selector)
+                if element is None:
+                    return None
+                return await page.evaluate("(e) => e.outerHTML", element)
+            finally:
+                await page.close()
+
+    # Returns the HTML of the element matching the CSS "selector" once "url" is rendered,
+    # the whole page if selector is None, or None if the element is not found.
+    def render(self, url, selector=None):
+        import asyncio
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._render(url, selector), self.loop
+        )
+        return future.result()
+
+    # Closes the browser and stops the event loop.
+    def close(self):
+        import asyncio
+
+        if self.browser is not None:
+            asyncio.run_coroutine_threadsafe(self.browser.close(), self.loop).result()
+            self.browser = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+# Returns the process-wide render worker.
+def get_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = RenderWorker()
+        return _worker
+
+
+# Closes the process-wide render worker, if it was started.
+def close_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.close()
+            _worker = None
@@ -0,0 +1,139 @@
+import datetime
+import json
+import threading
+import time
+
+import output
+
+# Prefix of the Prometheus metrics.
+METRIC_PREFIX = "opf_scraper_"
+
+# Per-calendar metrics written to the Prometheus file: name -> (key in the report, help).
+CALENDAR_METRICS = {
+    "calendar_fetch_seconds": ("fetch_seconds", "Time to refresh the cached page."),
+    "calendar_fetch_bytes": ("fetch_bytes", "Bytes downloaded, 0 if cached."),
+    "calendar_parse_seconds": ("parse_seconds", "Time to parse the page."),
+    "calendar_extract_seconds": ("extract_seconds", "Time to extract the events."),
+    "calendar_events": ("events", "Events scraped from the calendar."),
+}
+
+
+# Metrics of a run of the scraper, per calendar and per stage, written as a JSON report
+# and as a Prometheus textfile collector file.
+# Calendars are updated from the download threads, so the methods are thread-safe.
+class Report:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.calendars = dict()
+        self.stages = dict()
+        self.discarded = dict()  # reason -> events discarded after scraping
+        self.events = 0  # published events
+
+    # Merges "values" into the metrics of a calendar.
+    def update_calendar(self, calendar, values):
+        with self.lock:
+            self.calendars.setdefault(calendar, dict()).update(values)
+
+    # Adds "seconds" to the time spent in the stage "name".
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0) + seconds
+
+    # Adds {reason: count} to the events discarded after scraping.
+    def add_discarded(self, counts):
+        with self.lock:
+            for reason, count in counts.items():
+                self.discarded[reason] = self.discarded.get(reason, 0) + count
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "started": datetime.datetime.fromtimestamp(self.started).isoformat(
+                    timespec="seconds"
+                ),
+                "seconds": time.time() - self.started,
+                "events": self.events,
+                "stages": dict(self.stages),
+                "discarded": dict(self.discarded),
+                "calendars": {
+                    calendar: dict(metrics)
+                    for calendar, metrics in sorted(self.calendars.items())
+                },
+            }
+
+    def write_json(self, filename):
+        with open(output.temporary_filename(filename), "w") as f:
+            json.dump(self.as_dict(), f, indent=4)
+        output.publish(filename, False)
+
+    # Writes the metrics in the Prometheus text format, replacing the file at once as the
+    # textfile collector may read it at any time.
+    def write_prometheus(self, filename):
+        report = self.as_dict()
+        lines = []
+
+        def metric(name, help, samples):
+            lines.append("# HELP %s%s %s" % (METRIC_PREFIX, name, help))
+            lines.append("# TYPE %s%s gauge" % (METRIC_PREFIX, name))
+            for labels, value in samples:
+                lines.append(
+                    "%s%s%s %s" % (METRIC_PREFIX, name, format_labels(labels), value)
+                )
+
+        metric("last_run_timestamp_seconds", "End of the run.", [({}, time.time())])
+        metric("run_seconds", "Duration of the run.", [({}, report["seconds"])])
+        metric("published_events", "Events published.", [({}, report["events"])])
+        metric(
+            "stage_seconds",
+            "Time spent in each stage.",
+            [({"stage": s}, seconds) for s, seconds in report["stages"].items()],
+        )
+        metric(
+            "discarded_events",
+            "Events discarded after scraping, by reason.",
+            [({"reason": r}, count) for r, count in report["discarded"].items()],
+        )
+        calendars = report["calendars"]
+        for name, (key, help) in CALENDAR_METRICS.items():
+            metric(
+                name,
+                help,
+                [
+                    ({"calendar": calendar}, metrics[key])
+                    for calendar, metrics in calendars.items()
+                    if key in metrics
+                ],
+            )
+        metric(
+            "calendar_cache",
+            "1 for the state of the cached page: hit, revalidated, miss or error.",
+            [
+                ({"calendar": calendar, "status": metrics["cache"]}, 1)
+                for calendar, metrics in calendars.items()
+                if "cache" in metrics
+            ],
+        )
+        metric(
+            "calendar_discarded_events",
+            "Events discarded by the scraper, by reason.",
+            [
+                ({"calendar": calendar, "reason": reason}, count)
+                for calendar, metrics in calendars.items()
+                for reason, count in metrics.get("discarded", dict()).items()
+            ],
+        )
+        with open(output.temporary_filename(filename), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        output.publish(filename, False)
+
+
+# Returns the {labels} of a Prometheus sample, escaped.
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        escaped.append('%s="%s"' % (name, value.replace("\n", "\\n")))
+    return "{" + ",".join(escaped) + "}"
@@ -0,0 +1,82 @@
+import datetime
+import random
+
+# Bounds of the interval between two refreshes of a calendar.
+MIN_INTERVAL = datetime.timedelta(minutes=5)
+MAX_INTERVAL = datetime.timedelta(days=1)
+
+# Factors applied to the interval of a calendar after a refresh where its events changed,
+# and after one where they didn't, so that busy calendars are refreshed more often.
+SPEEDUP = 0.5
+SLOWDOWN = 1.5
+
+# Intervals are randomly shortened or lengthened by up to this fraction, so that calendars
+# started together don't stay in lockstep.
+JITTER = 0.1
+
+# Delay before retrying a calendar after a failure, doubled after each consecutive failure
+# up to MAX_INTERVAL.
+RETRY_INTERVAL = datetime.timedelta(minutes=5)
+
+
+def _clamp(interval):
+    return max(MIN_INTERVAL, min(MAX_INTERVAL, interval))
+
+
+def _jittered(interval):
+    return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+# Refresh schedule of one calendar. The fingerprint identifies the events of its last
+# successful refresh, and is None until then.
+class CalendarSchedule:
+    def __init__(self, interval, now):
+        self.interval = _clamp(interval)
+        self.failures = 0
+        self.fingerprint = None
+        self.due = now
+
+    # Records a successful refresh at "now" whose events have "fingerprint", and schedules
+    # the next one. Returns whether the events changed.
+    def succeeded(self, now, fingerprint):
+        changed = fingerprint != self.fingerprint
+        if self.fingerprint is not None:
+            self.interval = _clamp(self.interval * (SPEEDUP if changed else SLOWDOWN))
+        self.fingerprint = fingerprint
+        self.failures = 0
+        self.due = now + _jittered(self.interval)
+        return changed
+
+    # Records a failed refresh at "now", and schedules a retry.
+    def failed(self, now):
+        self.failures += 1
+        retry = min(RETRY_INTERVAL * 2 ** (self.failures - 1), MAX_INTERVAL)
+        self.due = now + _jittered(retry)
+
+
+# Refresh schedules of a set of calendars.
+class Scheduler:
+    def __init__(self):
+        self.schedules = dict()  # calendar -> CalendarSchedule
+
+    # Makes the schedules match {calendar: initial interval}: new calendars are due at
+    # "now", and the schedules of the calendars that are gone are dropped.
+    def sync(self, intervals, now):
+        for calendar in list(self.schedules):
+            if calendar not in intervals:
+                del self.schedules[calendar]
+        for calendar, interval in intervals.items():
+            if calendar not in self.schedules:
+                self.schedules[calendar] = CalendarSchedule(interval, now)
+
+    def get(self, calendar):
+        return self.schedules[calendar]
+
+    # Returns the calendars due at "now", the most overdue first.
+    def due(self, now):
+        due = [(s.due, c) for c, s in self.schedules.items() if s.due <= now]
+        return [c for _, c in sorted(due, key=lambda d: d[0])]
+
+    # Returns when the next calendar is due, or None if there are none.
+    def next_due(self):
+        return min((s.due for s in self.schedules.values()), default=None)
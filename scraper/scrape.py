@@ -1,23 +1,34 @@
 ﻿import argparse
-from typing import Tuple, List
-from babel.dates import format_date
-from jinja2 import Environment, PackageLoader, select_autoescape
+import collections
+import concurrent.futures
+import multiprocessing
+import threading
+import urllib.parse
+from typing import Iterable, Iterator, Tuple, List
 import datetime
-import dateparser
+import gzip
+import io
 import json
-import arrow
 import math
 import os
 import re
+import time
 import base64
-import requests
-import string
-import json
-from ics import Calendar
-import requests
-from bs4 import BeautifulSoup
-from requests_html import HTMLSession
+import hashlib
+import heapq
+import cities
+import dates
+import http_client
+import ical
+import output
+import render
+import report
+import scheduler
 import sheets
+import store
+
+# Heavy dependencies (bs4, jinja2, babel, the Google API client, pyppeteer, dateparser) are
+# imported by the functions that need them, so that runs that don't use them start fast.
 
 # TODO: replace the tuples in this code with dictionaries using these keys.
 KEY_TITLE = "title"
@@ -34,24 +45,18 @@ KEY_ELEMENT_ID = "id"
 KEY_LANG_EN = "en"
 KEY_LANG_FR = "fr"
 
+# Name of the file listing the event shards, see EventShardWriter.
+SHARD_MANIFEST = "manifest.json"
 
-# Returns a Date object (at midnight) for the given strptime format, or None on failure.
-# If the year is not parsed (1900), it's set to the current year.
-# https://docs.python.org/3/library/datetime.html#strftime-strptime-behavior
-def maybeParseDate(date_string, format):
-    try:
-        dt = datetime.datetime.strptime(date_string, format)
-        date = dt.date()
-        if date.year == 1900:
-            return datetime.date(datetime.datetime.today().year, date.month, date.day)
-        return date
-    except ValueError:
-        return None
+# (sheet name, range) of the language strings of each page.
+MAIN_PAGE_STRINGS = ("MainPage", "A1:D50")
+ABOUT_PAGE_STRINGS = ("AboutPage", "A1:C4")
 
 
 # All the scrape_ functions below extract events from various ticketing sytem pages.
 # soup: BeautifulSoup object, see https://www.crummy.com/software/BeautifulSoup/bs4/doc/
-# Return: array of tuples (title, event name, date, place, url, language)
+# Return: array of tuples (title, event name, date, place, url, language). The scrapers
+# of the parsed pages yield them instead, so that no list is built before scrape_soup().
 
 
 # TODO: remove this function. It's here for backwards compatibility.
@@ -68,9 +73,27 @@ def tuple_to_event(
     )
 
 
+# Events skipped by the scrapers and filters since the last take_discarded(), by reason.
+_discarded = collections.Counter()
+
+
+# Counts an event skipped for "reason": online, training, unparsable_date, no_location,
+# not_swiss or duplicate.
+def discard(reason):
+    _discarded[reason] += 1
+
+
+# Returns the counts of discard() since the last call, and resets them.
+def take_discarded():
+    counts = dict(_discarded)
+    _discarded.clear()
+    return counts
+
+
 # BilletWeb
+# The strings are read with .text rather than .string, whose NavigableStrings would keep
+# the whole soup alive, and can't be sent back by the --parse_workers processes.
 def scrape_BilletWeb(soup, title, language):
-    events = []
     for tag in soup.find_all("div", class_="multi_event_container"):
         child = tag.find("div", class_="multi_event_info_empty")
         if child:
@@ -81,9 +104,10 @@ def scrape_BilletWeb(soup, title, language):
             if not "multi_event_info_empty" in tag["class"]:
                 print("BilletWeb name not found? ", tag)
             continue
-        name = child.string
+        name = child.text
         if "FORMATION ANIMATION" in name.upper():
             print("Seems to be a facilitator training, skipping:", name)
+            discard("training")
             continue
 
         child = tag.find("div", class_="multi_event_date")
@@ -92,54 +116,34 @@ def scrape_BilletWeb(soup, title, language):
             continue
         child2 = child.span
         if child2 is None:
-            print("unexpected date:", child)
+            child2 = child  # older pages have the date directly in the div
         date_strings = []  # deal with multi-dates
         for child3 in child2.find_all("span", class_="multi_event_time"):
-            date_strings.append(child3.string)
+            date_strings.append(child3.text)
         if len(date_strings) == 0:
-            date_strings.append(child2.string)
-        dates = []
+            date_strings.append(child2.text)
+        event_dates = []
         for date_string in date_strings:
-            # TODO: there has got to be better ways to parse these strings.
-            date = dateparser.parse(
-                date_string,
-                settings=dict(
-                    {
-                        "DATE_ORDER": "DMY",
-                        "REQUIRE_PARTS": ["day", "month"],
-                        "SKIP_TOKENS": [
-                            "Mon",
-                            "Tue",
-                            "Wed",
-                            "Thu",
-                            "Fri",
-                            "Sat",
-                            "Sun",
-                        ],
-                    }
-                ),
-            )
-            if not date:
-                date = maybeParseDate(date_string, "%a %m/%d")  # ex: Sun 03/25
-            if not date:
-                date = maybeParseDate(
-                    date_string[0:16], "%a %b %d, %Y"
-                )  # ex: Sun Mar 03, 2023
+            date = dates.parse_date(date_string, dates.PLATFORM_BILLETWEB)
             if not date:
                 print(
                     "Cannot parse date, discarding event:",
                     date_string,
                     "(" + title + ")",
                 )
+                discard("unparsable_date")
                 continue
-            dates.append(date)
+            event_dates.append(date)
+        if not event_dates:
+            continue  # already counted as unparsable
 
         child = tag.find("div", class_="multi_event_place")
         if not child:
             print("Place not found?", tag)
             continue
-        place = child.span.string
+        place = child.span.text
         if not place:
+            discard("online")
             continue  # skip online-only events
 
         child = tag.find("div", class_="multi_event_button")
@@ -164,9 +168,8 @@ def scrape_BilletWeb(soup, title, language):
         real_language = language
         if "Biodiversity Collage" in name:
             real_language = "en"
-        for date in dates:
-            events.append((title, name, date, place, url, real_language))
-    return events
+        for date in event_dates:
+            yield (title, name, date, place, url, real_language)
 
 
 # BilletWeb
@@ -182,22 +185,40 @@ def scrape_BilletWebShop(soup, title, url, language):
             y = txt.find("'))")
             convertsample = txt[x + z : y]
 
-            # convert to a JSON dictionary
-            convertbytes = convertsample.encode("ascii")
-            convertedbytes = base64.b64decode(convertbytes)
-            decodedsample = convertedbytes.decode("ascii")
-            json_data = json.loads(decodedsample)
-
-            # extract the events
-            if json_data["status"] == "sold_out":
-                break
-            for ed in json_data["payload"]:
-                date = datetime.date.fromtimestamp(ed["start_day"])
-                place = ed["place"]
-                events.append((title, title, date, place, url, language))
+            events = BilletWebShop_events(
+                convertsample.encode("ascii"), title, url, language
+            )
+            break
     return events
 
 
+# Returns the events of the base64-encoded JSON sessions of a BilletWeb shop.
+def BilletWebShop_events(payload, title, url, language):
+    json_data = json.loads(base64.b64decode(payload).decode("ascii"))
+    events = []
+    if json_data["status"] == "sold_out":
+        return events
+    for ed in json_data["payload"]:
+        date = datetime.date.fromtimestamp(ed["start_day"])
+        place = ed["place"]
+        events.append((title, title, date, place, url, language))
+    return events
+
+
+# BilletWeb shop pages embed their sessions as JSON.parse(Base64.decode('...')).
+BILLETWEB_SHOP_PAYLOAD = re.compile(
+    rb"json_session_data\s*=\s*JSON\.parse\(\s*Base64\.decode\(\s*'([A-Za-z0-9+/=]*)'"
+)
+
+
+# BilletWeb shop, without DOM: returns None if the page doesn't embed its sessions.
+def fast_BilletWebShop(data, url, title, language):
+    match = BILLETWEB_SHOP_PAYLOAD.search(data)
+    if not match:
+        return None
+    return BilletWebShop_events(match.group(1), title, url, language)
+
+
 # Fresque du Climat: we truncate to the first three per language to avoid drowning out other workshops
 def has_class_my3_only(tag):
     if not tag.name == "div":
@@ -209,7 +230,6 @@ def has_class_my3_only(tag):
 
 
 def scrape_FresqueDuClimat(soup, title):
-    events = []
     tag = soup.find(has_class_my3_only)
     max_count = 3
     for child in tag.find_all("a", class_="text-decoration-none")[:max_count]:
@@ -224,7 +244,13 @@ def scrape_FresqueDuClimat(soup, title):
         child4 = divs[0].find("small", class_="text-secondary")
         x = child4.text.split("·")
         date_string = x[0].strip()
-        date = dateparser.parse(date_string).date()
+        date = dates.parse_date(date_string, dates.PLATFORM_CLIMATEFRESK)
+        if not date:
+            print(
+                "Cannot parse date, discarding event:", date_string, "(" + title + ")"
+            )
+            discard("unparsable_date")
+            continue
         place = re.sub(r"\s+", " ", x[2].strip())
 
         # title, language
@@ -244,17 +270,14 @@ def scrape_FresqueDuClimat(soup, title):
         else:
             raise Exception("Language not handled: " + language)
 
-        events.append(
-            sheets.Event(
-                name=title,
-                date=date,
-                location=place,
-                url=url,
-                organizer="CF",
-                language=language,
-            )
+        yield sheets.Event(
+            name=title,
+            date=date,
+            location=place,
+            url=url,
+            organizer="CF",
+            language=language,
         )
-    return events
 
 
 def is_EventBrite_location(tag):
@@ -267,7 +290,6 @@ def is_EventBrite_location(tag):
 
 # EventBrite
 def scrape_EventBrite(soup, title):
-    events = []
     for tag in soup.find_all("ul", class_="cc-card-list"):
         for card in tag.find_all("li", class_="cc-card-list__item"):
             child = card.find("h3", class_="eds-event-card-content__title")
@@ -282,18 +304,20 @@ def scrape_EventBrite(soup, title):
             if not child:
                 raise Exception("Subtitle element for date not found")
             date_string = child.text
-            date = maybeParseDate(date_string[:11], "%a, %b %d")  # ex: Tue, Mar 21
+            date = dates.parse_date(date_string, dates.PLATFORM_EVENTBRITE)
             if not date:
                 print(
                     "Cannot parse date, discarding event:",
                     date_string,
                     "(" + title + ")",
                 )
+                discard("unparsable_date")
                 continue
 
             child = card.find(is_EventBrite_location)
             if not child:
                 if "EN LIGNE" in name.upper():
+                    discard("online")
                     continue
                 raise Exception("Location element not found:", card)
             place = child.text
@@ -303,45 +327,124 @@ def scrape_EventBrite(soup, title):
                 raise Exception("Action link element for URL not found")
             url = child["href"]
 
-            events.append(
-                (
-                    title,
-                    name,
-                    date,
-                    place,
-                    url,
-                    "fr",
-                )
+            yield (
+                title,
+                name,
+                date,
+                place,
+                url,
+                "fr",
             )
-    return events
 
 
-# ICAL format
-def scrape_ICal(fp, url, title):
+# EventBrite pages embed their events as JSON in "window.__SERVER_DATA__", which lets us
+# skip rendering the page when it is present.
+EVENTBRITE_SERVER_DATA = re.compile(r"window\.__SERVER_DATA__\s*=\s*")
+
+
+# Returns the JSON object embedded in an EventBrite page, or None.
+def find_EventBrite_server_data(text):
+    match = EVENTBRITE_SERVER_DATA.search(text)
+    if not match:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, match.end())
+    except ValueError:
+        return None
+    return data
+
+
+# Yields the dictionaries that look like EventBrite API events, wherever they are nested.
+def find_EventBrite_events(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from find_EventBrite_events(item)
+    elif isinstance(data, dict):
+        name = data.get("name")
+        start = data.get("start")
+        if (
+            isinstance(name, dict)
+            and "text" in name
+            and isinstance(start, dict)
+            and "local" in start
+            and "url" in data
+        ):
+            yield data
+            return
+        for value in data.values():
+            yield from find_EventBrite_events(value)
+
+
+# Returns whether an EventBrite page embeds its events, so that it needs no rendering.
+def has_EventBrite_events(text):
+    data = find_EventBrite_server_data(text)
+    return data is not None and next(find_EventBrite_events(data), None) is not None
+
+
+# EventBrite, without DOM: returns None if the page doesn't embed its events.
+def fast_EventBrite(data, url, title, language):
+    return scrape_EventBriteServerData(data.decode("utf-8", "replace"), title)
+
+
+# EventBrite, without JavaScript: returns None if the page doesn't embed its events, even
+# if it has server data, so that the rendered event list is scraped instead.
+def scrape_EventBriteServerData(text, title):
+    data = find_EventBrite_server_data(text)
+    if data is None:
+        return None
     events = []
-    c = Calendar(requests.get(url).text)
-    for e in c.events:
-        if "Formation" in e.name:
+    seen = set()
+    for ed in find_EventBrite_events(data):
+        key = (ed["url"], ed["start"]["local"])
+        if key in seen:
+            continue  # the same event can be listed in several places
+        seen.add(key)
+        name = ed["name"]["text"]
+        venue = ed.get("venue")
+        if ed.get("online_event") or not venue:
+            discard("online")
+            continue  # skip online events
+        address = venue.get("address") or dict()
+        place = address.get("localized_address_display") or venue.get("name")
+        if not place:
+            print("Location not found, discarding event:", name, "(" + title + ")")
+            discard("no_location")
+            continue
+        date = datetime.date.fromisoformat(ed["start"]["local"][0:10])
+        events.append((title, name, date, place, ed["url"], "fr"))
+    if not seen:
+        return None
+    return events
+
+
+# ICAL format, only the events of the next "horizon_days" days are read.
+def scrape_ICal(fp, url, title, horizon_days=ical.HORIZON_DAYS):
+    today = datetime.date.today()
+    end = today + datetime.timedelta(days=horizon_days)
+    for e in ical.read_events(fp, today, end):
+        name = e.get("SUMMARY", "")
+        location = e.get("LOCATION")
+        if "Formation" in name:
+            discard("training")
             continue  # skip facilitation trainings
-        if not e.location:
+        if not location:
+            discard("online")
             continue  # skip online events
-        if not "Suisse" in e.location:
+        if not "Suisse" in location:
+            discard("not_swiss")
             continue
         title = "Atelier GreenDonut"
-        if "TEXTILE" in e.name.upper():
+        if "TEXTILE" in name.upper():
             title = "Fresque du Textile"
-        elif "DECHETS" in e.name.upper():
+        elif "DECHETS" in name.upper():
             title = "Fresque des Déchets"
-        events.append(
-            sheets.Event(
-                name=title,
-                date=e.begin.datetime,
-                location=e.location,
-                url="https://calendar.google.com/calendar/u/0/embed?src=greendonut.info@gmail.com&ctz=Europe/Paris",
-                language="fr",
-            )
+        yield sheets.Event(
+            name=title,
+            date=e["DTSTART"],
+            location=location,
+            url="https://calendar.google.com/calendar/u/0/embed?src=greendonut.info@gmail.com&ctz=Europe/Paris",
+            language="fr",
         )
-    return events
 
 
 # Watted, specifically PowerPlay
@@ -350,153 +453,564 @@ def is_Watted_event(tag):
 
 
 def scrape_Watted_PowerPlay(soup):
-    events = []
     for tag in soup.find_all(is_Watted_event):
         p = tag.parent
         t = p.text
         i = t.find(" :")
         tokens = t[0:i].split(",")
         date_string = tokens[1].strip()
-        date = dateparser.parse(date_string).date()
-        if date < date.today():
-            date = datetime.date(date.year + 1, date.month, date.day)
+        date = dates.parse_date(date_string, dates.PLATFORM_WATTED)
         if not date:
             print("Skipping Watted event, unable to extract date from", date_string)
+            discard("unparsable_date")
             continue
+        if date < date.today():
+            date = datetime.date(date.year + 1, date.month, date.day)
         location = ", ".join([x.strip() for x in tokens[2:] + [tokens[0]]])
-        events.append(
-            sheets.Event(
-                name="Power Play",
-                date=date,
-                location=location,
-                url=tag.get("href"),
-                language="en" if "Zürich" in location else "fr",
-            )
+        yield sheets.Event(
+            name="Power Play",
+            date=date,
+            location=location,
+            url=tag.get("href"),
+            language="en" if "Zürich" in location else "fr",
         )
-    return events
 
 
-# Given an array of events, filters for Switzerland and appends to each tuple the identified city.
-# Input: array of (title, event name, date, place, url, language)
-# Output: array of (title, event name, date, place, url, language, city)
+# Given a stream of events, filters for Switzerland and sets the identified city of each.
+# Places are resolved by "resolver", by default one that isn't saved, see
+# cities.LocationResolver.
 def append_city_and_filter_for_switzerland(
-    events: List[sheets.Event], debug: bool
-) -> List[sheets.Event]:
-    normalizer = str.maketrans("ÜÈÂ", "UEA")
-    cities = dict()
-    for c in (
-        "Arosa",
-        "Bâle",
-        "Basel",
-        "Bercher",
-        "Bern",
-        "Biel",
-        "Bienne",
-        "Bulle",
-        "Divonne",
-        "Dübendorf",
-        "Estavayer",
-        "Fribourg",
-        "Genève",
-        "Gland",
-        "Horgen",
-        "Kaufdorf",
-        "Lausanne",
-        "Le Grand-Saconnex",
-        "Mont-Vully",
-        "Morges",
-        "Moudon",
-        "Neuchâtel",
-        "Nyon",
-        "Penthalaz",
-        "Pully",
-        "Rolle",
-        "Sion",
-        "St. Gallen",
-        "St. Sulpice",
-        "Vevey",
-        "Yverdon",
-        "Zürich",
-    ):
-        cities[c.upper().translate(normalizer)] = c
-    filtered = []
+    events: Iterable[sheets.Event], debug: bool, resolver=None
+) -> Iterator[sheets.Event]:
+    if resolver is None:
+        resolver = cities.load_resolver()
     for event in events:
         name = event.name
         place = event.location
-        normalized_place = place.upper().translate(normalizer)
-
-        if normalized_place.endswith("BELGIQUE"):
-            continue
-
-        city = None
-        for normalized_city, c in cities.items():
-            if (
-                normalized_place.startswith(normalized_city)
-                or re.search(r"[( ,]" + normalized_city, normalized_place)
-            ) and not "FRANCE" in normalized_place:
-                city = c
-                break
+        city, _, where = resolver.resolve(place)
 
-        if not city and "SEV52" in normalized_place:
-            city = "Lausanne"
-
-        if not city:
+        if where != cities.IN_SWITZERLAND:
             calendar = event.name
-            if "Climate Fresk" in calendar or "Fresque du Climat" in calendar:
+            if where == cities.UNKNOWN and (
+                "Climate Fresk" in calendar or "Fresque du Climat" in calendar
+            ):
                 raise Exception("Missed Swiss city:", place, "(" + name + ")")
             if debug:
                 print("Discarding, not in Switzerland:", place, "(" + name + ")")
+            discard("not_swiss")
             continue
 
         if city == "Divonne":
             city = city + ' <img src="flags/icons8-fr-16.png" alt="fr"/>'
         event.city = city
-        filtered.append(event)
-    return filtered
+        yield event
+
+
+# How long a cached page stays fresh before being revalidated, by URL prefix of the
+# ticketing platform. Platforms that don't provide validators are re-downloaded entirely,
+# so they keep the default of a day.
+CACHE_FRESHNESS = {
+    "https://www.billetweb.fr/": datetime.timedelta(hours=1),
+    "https://www.eventbrite.": datetime.timedelta(days=1),
+}
+DEFAULT_CACHE_FRESHNESS = datetime.timedelta(days=1)
 
 
-# Refreshes the file at "filename", if at least a day behind "today", with the contents at "url".
-def refresh_cache(filename, today, url):
+# Returns how long the cached page of "url" stays fresh.
+def cache_freshness(url):
+    for prefix, freshness in CACHE_FRESHNESS.items():
+        if url.startswith(prefix):
+            return freshness
+    return DEFAULT_CACHE_FRESHNESS
+
+
+# The response validators (ETag, Last-Modified) of a cache file are kept in a JSON sidecar.
+def cache_metadata_filename(filename):
+    return filename + ".meta.json"
+
+
+def read_cache_metadata(filename):
+    try:
+        with open(cache_metadata_filename(filename)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def write_cache_metadata(filename, url, headers):
+    metadata = {"url": url}
+    if "ETag" in headers:
+        metadata["etag"] = headers["ETag"]
+    if "Last-Modified" in headers:
+        metadata["last_modified"] = headers["Last-Modified"]
+    with open(cache_metadata_filename(filename), "w") as f:
+        json.dump(metadata, f)
+
+
+# Refreshes the file at "filename" with the contents at "url", if it is older than
+# "freshness", by default the freshness window of the platform. When the previous response
+# had validators, the page is revalidated and only downloaded again if it changed on the
+# server.
+# Returns (state of the cache: "hit", "revalidated" or "miss", bytes downloaded).
+# Raises if the page can't be downloaded, leaving the cached page as it was.
+def refresh_cache(filename, today, url, freshness=None):
+    if freshness is None:
+        freshness = cache_freshness(url)
     try:
         ts = os.path.getmtime(filename)
     except OSError:
         ts = 0
     filetime = datetime.datetime.fromtimestamp(ts)
     delta = today - filetime
-    if delta.days >= 1:
+    if delta >= freshness:
         print('Refreshing "' + filename + '" from ' + url + ", date was", filetime)
 
-        if url.startswith("https://www.eventbrite.com/"):
-            session = HTMLSession()
-            r = session.get(url)
-            r.html.render()  # this call executes the js in the page
-            with open(filename, "w") as f:
-                print(r.html.find("ul.cc-card-list", first=True).html, file=f)
-        else:
-            r = requests.get(url)
-            with open(filename, "w") as f:
-                print(r.text, file=f)
+        headers = dict()
+        metadata = read_cache_metadata(filename)
+        if ts and metadata.get("url") == url:
+            if "etag" in metadata:
+                headers["If-None-Match"] = metadata["etag"]
+            if "last_modified" in metadata:
+                headers["If-Modified-Since"] = metadata["last_modified"]
+        r = http_client.get(url, headers=headers)
+        if r.status_code == 304:
+            print('"' + filename + '" has not changed')
+            os.utime(filename)
+            return "revalidated", 0
+        if not r.ok:
+            raise Exception("HTTP status %d for %s" % (r.status_code, url))
+        text = r.text
+        rendered = False
+        if needs_render(url) and not has_EventBrite_events(text):
+            # The events are only in the page once its JavaScript has run.
+            text = render.get_worker().render(url, "ul.cc-card-list")
+            if text is None:
+                raise Exception("Event list not found in rendered page: " + url)
+            rendered = True
+        write_cache(filename, trim_page(text, url))
+        if not rendered:
+            write_cache_metadata(filename, url, r.headers)
+        return "miss", len(r.content)
+    return "hit", 0
+
+
+# Cache files hold the part of the page their scraper reads, see trim_page(), compressed.
+def write_cache(filename, text):
+    with open(output.temporary_filename(filename), "wb") as f:
+        f.write(gzip.compress(text.encode("utf-8"), mtime=0))
+    os.replace(output.temporary_filename(filename), filename)
+
+
+# Returns the content of a cache file as bytes. Pages saved by hand, like the testdata, are
+# not compressed.
+def read_cache(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+    if data[:2] == b"\x1f\x8b":
+        return gzip.decompress(data)
+    return data
+
+
+# Returns the part of a page its scraper reads: the embedded events of the pages with a
+# fast extractor (see FAST_EXTRACTORS), otherwise the subtree of PARSE_ONLY. Other pages,
+# like the calendars in the ICal format, are kept whole.
+def trim_page(text, url):
+    if url.startswith("https://www.billetweb.fr/shop.php"):
+        match = BILLETWEB_SHOP_PAYLOAD.search(text.encode("utf-8"))
+        if match:
+            payload = match.group(1).decode("ascii")
+            return (
+                "<script>json_session_data=JSON.parse(Base64.decode('"
+                + payload
+                + "'));</script>"
+            )
+    if url.startswith("https://www.eventbrite."):
+        match = EVENTBRITE_SERVER_DATA.search(text)
+        try:
+            if match:
+                data, end = json.JSONDecoder().raw_decode(text, match.end())
+                # Without events, the rendered event list is kept below instead.
+                if next(find_EventBrite_events(data), None) is not None:
+                    return "<script>" + text[match.start() : end] + ";</script>"
+        except ValueError:
+            pass  # not valid JSON
+    for prefix in PARSE_ONLY:
+        if url.startswith(prefix):
+            return str(parse_page(text, url, "html.parser"))
+    return text
+
+
+# Suffixes of the sidecars of a cache file, see cache_metadata_filename() and
+# parsed_events_filename().
+CACHE_SIDECAR_SUFFIXES = (".meta.json", ".events.json")
+
+
+# Deletes the cache files of the calendars other than "calendars", along with their
+# sidecars, least recently refreshed first, until the cache files in "cache_dir" take at
+# most "budget" bytes. The files of the calendars being read are always kept, as well as the
+# files of the directory that are not cache files.
+# Returns the number of calendars deleted from the cache.
+def evict_cache(cache_dir, calendars, budget):
+    entries = dict()  # cache file -> [bytes, last modification time, files]
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        entry = path
+        for suffix in CACHE_SIDECAR_SUFFIXES:
+            entry = entry.removesuffix(suffix)
+        if not entry.endswith((".html", ".html.gz")) or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        size_mtime_files = entries.setdefault(entry, [0, 0, []])
+        size_mtime_files[0] += stat.st_size
+        size_mtime_files[1] = max(size_mtime_files[1], stat.st_mtime)
+        size_mtime_files[2].append(path)
+    current = set(cache_filename(cache_dir, c[0], c[2]) for c in calendars)
+    total = sum(size for size, _, _ in entries.values())
+    evicted = 0
+    for entry, (size, _, files) in sorted(entries.items(), key=lambda e: e[1][1]):
+        if total <= budget:
+            break
+        if entry in current:
+            continue
+        for path in files:
+            os.remove(path)
+        total -= size
+        evicted += 1
+    if evicted:
+        print("Evicted", evicted, "calendars from the cache.")
+    if total > budget:
+        print("The cache of the enabled calendars takes", total, "bytes, over budget.")
+    return evicted
+
+
+# Returns the name of a calendar in the logs and reports.
+def calendar_name(calendar):
+    return calendar[0] + " (" + calendar[2] + ")"
+
+
+# Returns the cache file used for a calendar.
+def cache_filename(cache_dir, title, language):
+    return os.path.join(cache_dir, title + "_" + language + ".html.gz")
+
+
+# Returns whether the page at "url" must be rendered in a browser before being cached,
+# when it doesn't embed its events.
+def needs_render(url):
+    return url.startswith("https://www.eventbrite.com/")
+
+
+# Refreshes the cache files of all calendars, yielding (index in calendars, filename) as soon
+# as each one is available. At most max_workers downloads run at once, and at most
+# max_per_host of them against the same host.
+# When a download fails, the previously cached page is used, and the filename is None if
+# there is none.
+# The fetch metrics of each calendar are recorded in "run_report" if not None.
+def fetch_calendars(
+    calendars, cache_dir, today, max_workers, max_per_host, run_report=None
+):
+    host_slots = dict()
+    for calendar in calendars:
+        host = urllib.parse.urlsplit(calendar[1]).netloc
+        host_slots[host] = threading.BoundedSemaphore(max_per_host)
+
+    def fetch(calendar, filename):
+        url = calendar[1]
+        with host_slots[urllib.parse.urlsplit(url).netloc]:
+            start = time.perf_counter()
+            try:
+                cache, size = refresh_cache(filename, today, url)
+            except Exception as err:
+                print("Failed to refresh", calendar_name(calendar) + ":", err)
+                cache, size = "error", 0
+            if run_report:
+                run_report.update_calendar(
+                    calendar_name(calendar),
+                    {
+                        "fetch_seconds": time.perf_counter() - start,
+                        "fetch_bytes": size,
+                        "cache": cache,
+                    },
+                )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = dict()
+        for i, calendar in enumerate(calendars):
+            filename = cache_filename(cache_dir, calendar[0], calendar[2])
+            futures[executor.submit(fetch, calendar, filename)] = (i, filename)
+        for future in concurrent.futures.as_completed(futures):
+            future.result()  # propagate unexpected errors
+            i, filename = futures[future]
+            yield i, filename if os.path.exists(filename) else None
+
+
+# Returns a SoupStrainer predicate matching tags that have "class_name" among their classes.
+# Depending on the BeautifulSoup version, the class attribute is given as a string or a list.
+def has_class(class_name):
+    def matches(value):
+        if value is None:
+            return False
+        if isinstance(value, str):
+            value = value.split()
+        return class_name in value
+
+    return matches
+
+
+# The subtree of the page each scraper looks at, by URL prefix of the ticketing platform,
+# as (tag name, class or None). Only these subtrees are built when parsing; pages of other
+# platforms are parsed entirely.
+PARSE_ONLY = {
+    "https://www.billetweb.fr/shop.php": ("script", None),
+    "https://www.billetweb.fr/": ("div", "multi_event_container"),
+    "https://association.climatefresk.org/": ("div", "my-3"),
+    "https://www.eventbrite.": ("ul", "cc-card-list"),
+}
+
+
+# Parses an HTML page, only building the subtree the scraper of "url" needs.
+# html_parser is the BeautifulSoup tree builder, e.g. "html.parser" or "lxml".
+def parse_page(fp, url, html_parser):
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    parse_only = None
+    for prefix, (name, class_name) in PARSE_ONLY.items():
+        if url.startswith(prefix):
+            if class_name:
+                parse_only = SoupStrainer(name, class_=has_class(class_name))
+            else:
+                parse_only = SoupStrainer(name)
+            break
+    return BeautifulSoup(fp, html_parser, parse_only=parse_only)
+
+
+# Bump when a scraper changes, so that the events cached by older versions are not reused.
+SCRAPER_VERSION = 6
+
+
+# The events extracted from a cache file are kept in a JSON sidecar, along with a hash of
+# everything they depend on: the page, the calendar, the scraper version, the horizon of
+# the ICal calendars and the day (dates without a year depend on it).
+def parsed_events_filename(filename):
+    return filename + ".events.json"
+
+
+def parsed_events_key(filename, url, title, language, horizon_days):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        h.update(f.read())
+    for s in (
+        url,
+        title,
+        language,
+        str(SCRAPER_VERSION),
+        str(horizon_days),
+        datetime.date.today().isoformat(),
+    ):
+        h.update(b"\0" + s.encode())
+    return h.hexdigest()
+
+
+# Returns (events, {discard reason: count}) cached for "filename", or None if the key
+# doesn't match.
+def read_parsed_events(filename, key):
+    try:
+        with open(parsed_events_filename(filename)) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("key") != key:
+        return None
+    events = [sheets.event_from_list(values) for values in cached["events"]]
+    return events, cached.get("discarded", dict())
+
+
+def write_parsed_events(filename, key, events, discarded):
+    with open(parsed_events_filename(filename), "w") as f:
+        json.dump(
+            {
+                "key": key,
+                "events": [sheets.event_to_list(e) for e in events],
+                "discarded": discarded,
+            },
+            f,
+            separators=(",", ":"),
+        )
+
+
+# Returns the events of a calendar, only parsing its cached page if it changed since the
+# last run, along with the metrics of the calendar for the run report.
+# This runs in worker processes with --parse_workers, so it must only return plain Events
+# and dictionaries.
+def scrape_calendar(
+    filename,
+    url,
+    title,
+    language,
+    html_parser="html.parser",
+    horizon_days=ical.HORIZON_DAYS,
+) -> Tuple[List[sheets.Event], dict]:
+    key = parsed_events_key(filename, url, title, language, horizon_days)
+    cached = read_parsed_events(filename, key)
+    if cached is not None:
+        events, discarded = cached
+        return events, {"parsed": "cached", "discarded": discarded}
+    metrics = {"parsed": "parsed", "parse_seconds": 0}
+    take_discarded()
+    start = time.perf_counter()
+    events = extract_events(
+        filename, url, title, language, html_parser, metrics, horizon_days
+    )
+    metrics["extract_seconds"] = (
+        time.perf_counter() - start - metrics["parse_seconds"]
+    )
+    metrics["discarded"] = take_discarded()
+    write_parsed_events(filename, key, events, metrics["discarded"])
+    return events, metrics
+
+
+# Extractors working on the raw bytes of a cached page with precompiled patterns, by URL
+# prefix of the ticketing platform. They return the event tuples, or None when the page
+# doesn't embed what they look for, and the page is then parsed for the DOM scrapers.
+FAST_EXTRACTORS = {
+    "https://www.billetweb.fr/shop.php": fast_BilletWebShop,
+    "https://www.eventbrite.": fast_EventBrite,
+}
+
+
+# Returns the fast extractor of the calendar at "url", or None.
+def fast_extractor(url):
+    for prefix, extractor in FAST_EXTRACTORS.items():
+        if url.startswith(prefix):
+            return extractor
+    return None
+
+
+# Loads the cached page of a calendar and extracts its events,
+# depending on the ticketing platform.
+# The time spent parsing the page is recorded in metrics["parse_seconds"] if given, and
+# metrics["extractor"] tells whether the fast extractor or the DOM was used.
+def extract_events(
+    filename,
+    url,
+    title,
+    language,
+    html_parser,
+    metrics=None,
+    horizon_days=ical.HORIZON_DAYS,
+) -> List[sheets.Event]:
+    if metrics is None:
+        metrics = dict()
+    data = read_cache(filename)
+    extractor = fast_extractor(url)
+    if extractor:
+        events = extractor(data, url, title, language)
+        if events is not None:
+            metrics["extractor"] = "fast"
+            return list(map(tuple_to_event, events))
+
+    with io.StringIO(data.decode("utf-8")) as fp:
+        if url.endswith(".ics") or url.startswith("https://framagenda.org/"):
+            return list(scrape_ICal(fp, url, title, horizon_days))
+
+        metrics["extractor"] = "dom"
+        start = time.perf_counter()
+        soup = parse_page(fp, url, html_parser)
+        metrics["parse_seconds"] = time.perf_counter() - start
+        return scrape_soup(soup, url, title, language)
+
+
+# Extracts the events of a parsed page, depending on the ticketing platform.
+def scrape_soup(soup, url, title, language) -> List[sheets.Event]:
+    if url.startswith("https://www.billetweb.fr/shop.php"):
+        return list(
+            map(
+                tuple_to_event,
+                scrape_BilletWebShop(soup, title, url, language),
+            )
+        )
+    elif url.startswith("https://www.billetweb.fr/"):
+        return list(map(tuple_to_event, scrape_BilletWeb(soup, title, language)))
+    elif url.startswith("https://association.climatefresk.org/"):
+        return list(scrape_FresqueDuClimat(soup, title))
+    elif url.startswith("https://www.eventbrite."):
+        return list(map(tuple_to_event, scrape_EventBrite(soup, title)))
+    elif url.startswith("https://www.watted.ch/"):
+        return list(scrape_Watted_PowerPlay(soup))
+    raise Exception("URL not handled: " + url)
+
+
+# The events flow from the scrapers to the writers through the streaming stages below:
+# merge_calendar_events, append_city_and_filter_for_switzerland, remove_duplicates,
+# check_urls, then write_events_as_json feeding the output writers.
+
+
+# Returns the day of an event, the order in which the events are published.
+def event_day(event: sheets.Event) -> int:
+    return event.date.toordinal()
+
+
+# Merges the lists of events of the calendars into a single stream sorted by day.
+# Events of the same day keep the order of their calendars.
+# Each list is sorted in place, and emptied as its events go down the stream, so that the
+# events are released once written; callers keeping their lists must pass copies.
+# The peak memory still grows with the total number of events: the scrapers return whole
+# lists, which are cached and sent back by the --parse_workers processes, and they must
+# all be sorted before the first event of the stream is known.
+def merge_calendar_events(
+    calendar_events: Iterable[List[sheets.Event]],
+) -> Iterator[sheets.Event]:
+    return heapq.merge(*map(drain_sorted, calendar_events), key=event_day)
+
+
+# Sorts a list of events by day, then yields them while removing them from the list.
+def drain_sorted(events: List[sheets.Event]) -> Iterator[sheets.Event]:
+    events.sort(key=event_day)
+    events.reverse()
+    while events:
+        yield events.pop()
+
+
+# Drops the events already seen with the same name, day and language.
+# The stream is sorted by day, so only the keys of the current day are remembered.
+def remove_duplicates(events: Iterable[sheets.Event]) -> Iterator[sheets.Event]:
+    day = None
+    seen = set()
+    removed = 0
+    for event in events:
+        if event_day(event) != day:
+            day = event_day(event)
+            seen.clear()
+        key = (event.name, event.language)
+        if key in seen:
+            print("Removing duplicate event:", event)
+            discard("duplicate")
+            removed += 1
+            continue
+        seen.add(key)
+        yield event
+    print("Removed", removed, "duplicated event(s)")
+
+
+# Fails on the first event without a valid URL.
+def check_urls(events: Iterable[sheets.Event]) -> Iterator[sheets.Event]:
+    for event in events:
+        if not event.url or not (
+            event.url.startswith("http://")
+            or event.url.startswith("https://")
+            or event.url.startswith("mailto:")
+        ):
+            raise Exception("Invalid URL in event", event)
+        yield event
 
 
 # write events as JSON
-def write_events_as_json(events: List[sheets.Event]):
-    ae = []
+# In compact mode, fields that the page doesn't read (the name, same as the title) are
+# left out.
+def write_events_as_json(events: Iterable[sheets.Event], compact: bool = False):
     t = datetime.time(0, 0)
+    gazetteer = cities.load_gazetteer()
     for event in events:
-        lregion = "Romandie"
-        if event.city in (
-            "Arosa",
-            "Basel",
-            "Bern",
-            "Dübendorf",
-            "Horgen",
-            "Kaufdorf",
-            "St. Gallen",
-            "Zürich",
-        ):
-            lregion = "Deutschschweiz"
-        elif event.city in ("Fribourg"):
-            lregion = "Sarine"
+        lregion = gazetteer.lregion(event.city)
         organizer = event.organizer
         de = {
             KEY_TITLE: event.name,
@@ -509,47 +1023,156 @@ def write_events_as_json(events: List[sheets.Event]):
             KEY_LINGUISTIC_REGION: lregion,
             KEY_ORGANIZER: organizer,
         }
-        ae.append(de)
-    return ae
+        if compact:
+            del de[KEY_NAME]
+        yield de
+
+
+# Fields the page filters the events on.
+FACET_KEYS = (KEY_LINGUISTIC_REGION, KEY_ORGANIZER, KEY_LANGUAGE)
+
+
+# Builds {field: {value: [indices]}} for the FACET_KEYS of the events (as returned by
+# write_events_as_json) added in their published order. The page selects the events by
+# intersecting these lists instead of scanning all of them.
+# A None value gets the "null" key, like String(null) in JavaScript.
+class FacetIndexes:
+    def __init__(self):
+        self.count = 0
+        self.facets = {key: dict() for key in FACET_KEYS}
+
+    def add(self, de):
+        for key, index in self.facets.items():
+            index.setdefault(de[key], []).append(self.count)
+        self.count += 1
+
+    def as_json(self):
+        return json.dumps(self.facets, separators=(",", ":"))
+
+
+# Writes the events.js file of the events (as returned by write_events_as_json) as they
+# come, followed by their facet indexes. The file is written under its temporary name, see
+# output.publish().
+def write_events_js(env, filename, ae, compact):
+    facets = FacetIndexes()
+
+    def indexed(ae):
+        for de in ae:
+            facets.add(de)
+            yield de
+
+    with open(output.temporary_filename(filename), "w") as f:
+        template = env.get_template("events.js")
+        template.stream(
+            {
+                "eventsAsJSON": output.iter_json_array(indexed(ae), compact),
+                "facetsAsJSON": facets.as_json,
+            }
+        ).dump(f)
+        f.write("\n")
+
+
+# Writes the events (as returned by write_events_as_json) into one JSON file per linguistic
+# region, and per month if by_month, along with a "manifest.json" listing them. This lets
+# the page only download the events of the regions it shows.
+# The shards are written under their temporary names as the events are added, and only
+# replace the published ones in publish(), when their content changed.
+# If versioned, the manifest lists the versions of the shards, see output.publish_version().
+class EventShardWriter:
+    def __init__(self, directory, by_month, compact, versioned=False):
+        self.directory = directory
+        self.by_month = by_month
+        self.compact = compact
+        self.versioned = versioned
+        self.shards = dict()  # (lregion, month) -> (file, JsonArrayWriter)
+
+    def add(self, de):
+        month = None
+        if self.by_month:
+            month = datetime.date.fromtimestamp(de[KEY_DATE]).strftime("%Y-%m")
+        key = (de[KEY_LINGUISTIC_REGION], month)
+        if key not in self.shards:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            f = open(output.temporary_filename(self._path(key)), "w")
+            self.shards[key] = (f, output.JsonArrayWriter(f, self.compact))
+        self.shards[key][1].write(de)
+
+    def _path(self, key):
+        lregion, month = key
+        shard = "events_" + lregion + ("_" + month if month else "") + ".json"
+        return os.path.join(self.directory, shard)
+
+    def _close(self):
+        for f, writer in self.shards.values():
+            writer.close()
+            f.close()
+
+    # Replaces the published shards and their manifest by the ones written.
+    def publish(self):
+        self._close()
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        manifest = []
+        written = set()
+        for key in sorted(self.shards.keys(), key=str):
+            path = self._path(key)
+            output.publish(path, self.compact)
+            written.add(os.path.basename(path))
+            if self.versioned:
+                path = output.publish_version(path)
+            manifest.append(
+                {
+                    "file": os.path.basename(path),
+                    KEY_LINGUISTIC_REGION: key[0],
+                    "month": key[1],
+                    "count": self.shards[key][1].count,
+                }
+            )
+        manifest_filename = os.path.join(self.directory, SHARD_MANIFEST)
+        with open(output.temporary_filename(manifest_filename), "w") as f:
+            f.write(dump_json({"shards": manifest}, self.compact))
+        output.publish(manifest_filename, self.compact)
 
+        # Remove the shards of previous runs that are now empty, and their versions.
+        for filename in os.listdir(self.directory):
+            shard = filename.removesuffix(".gz").removesuffix(".br")
+            shard = output.unversioned_filename(shard) or shard
+            if shard.startswith("events_") and shard.endswith(".json"):
+                if shard not in written:
+                    os.remove(os.path.join(self.directory, filename))
 
-def main():
-    # Parse the command-line flags.
-    argParser = argparse.ArgumentParser()
-    argParser.add_argument(
-        "-c",
-        "--cache_dir",
-        default="cache",
-        help="Directory where the HTML files are cached for 1 day to reduce host load.",
-    )
-    argParser.add_argument(
-        "-ap",
-        "--about_prefix",
-        default=None,
-        help="Output 'about' HTML files to write, disabled if left empty. Don't include the extension as the program will append _<language>.'",
-    )
-    argParser.add_argument(
-        "-e",
-        "--events_js",
-        default=None,
-        help="Output 'events.js' JavaScript file to write, disabled if left empty.",
-    )
-    argParser.add_argument(
-        "-m",
-        "--main_html",
-        default=None,
-        help="Output 'main' HTML file to write, disabled if left empty.",
-    )
-    argParser.add_argument(
-        "-d", "--debug", default=False, help="Whether to output debug information."
-    )
-    args = argParser.parse_args()
 
-    env = Environment(
+# Returns "value" as JSON, indented for readability unless compact.
+def dump_json(value, compact):
+    if compact:
+        return json.dumps(value, separators=(",", ":"))
+    return json.dumps(value, indent=4)
+
+
+# Returns the environment of the page templates.
+# Compiled templates are kept in a bytecode cache, so they are only compiled once.
+def template_environment():
+    from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
+
+    return Environment(
         loader=PackageLoader("scrape"),
         autoescape=False,  # TODO: replace with select_autoescape()
+        bytecode_cache=FileSystemBytecodeCache(),
     )
 
+
+# Reads the workshops from the main spreadsheet, along with the strings of the pages to
+# write. Returns the calendars as tuples (workshop name, calendar URL, language, main site).
+def read_calendars(args):
+    # Read everything we need from the main spreadsheet in a single request.
+    ranges = [sheets.WORKSHOPS_RANGE]
+    if args.main_html:
+        ranges.append(sheets.language_strings_range(*MAIN_PAGE_STRINGS))
+    if args.about_prefix:
+        ranges.append(sheets.language_strings_range(*ABOUT_PAGE_STRINGS))
+    sheets.prefetch(sheets.SAMPLE_SPREADSHEET_ID, ranges)
+
     # Set up the list of calendars we are going to read.
     workshops = sheets.get_workshops()
     # TODO: stop using calendars (list of tuples) in favor of workshops (list of classes)
@@ -565,156 +1188,148 @@ def main():
             )
         )
     calendars.sort(key=lambda c: c[0])  # sort by workshop name
+    return calendars
 
-    env = Environment(
-        loader=PackageLoader("scrape"),
-        autoescape=False,  # TODO: replace with select_autoescape()
-    )
-    today = datetime.datetime.today()
 
-    if args.events_js:
-        # Prepare cache.
-        if not os.path.exists(args.cache_dir):
-            os.mkdir(args.cache_dir)
+def read_manual_events():
+    all_events = []
 
-        all_events = []
-
-        # Start with events we have manually authored.
-        # TODO: Remove entirely? This is now disabled in favor of direct updates from AppScript.
-        if False:
-            for suffix in ["FZC", "extra"]:
-                organizer = None if suffix == "extra" else suffix
-                all_events.extend(
-                    sheets.get_manual_events(
-                        "1totCMhD_sRcU1b3JNICTUWXcYoYPOjQRo9KLv8NW4x8",
-                        "Calendrier: " + suffix + "!A1:I50",
-                        "Workshop",
-                        "Date",
-                        "Location",
-                        "Link",
-                        "Languages",
-                        "Visible",
-                        organizer,
-                    )
-                )
+    # Start with events we have manually authored.
+    # TODO: Remove entirely? This is now disabled in favor of direct updates from AppScript.
+    if False:
+        for suffix in ["FZC", "extra"]:
+            organizer = None if suffix == "extra" else suffix
             all_events.extend(
                 sheets.get_manual_events(
-                    "10XKUvvU_b-js3kC7Q25VrtYW-flt-qsvwvUThveusOo",
-                    "2025!A1:H50",
-                    "Workshop name",
+                    "1totCMhD_sRcU1b3JNICTUWXcYoYPOjQRo9KLv8NW4x8",
+                    "Calendrier: " + suffix + "!A1:I50",
+                    "Workshop",
                     "Date",
                     "Location",
                     "Link",
                     "Languages",
-                    "Live on oneplanetfriends.org",
-                    "OPF",
+                    "Visible",
+                    organizer,
                 )
             )
-        print(len(all_events), "added manually.")
-
-        # Add scraped events.
-        for calendar in calendars:
-            events = []
-            title = calendar[0]
-            url = calendar[1]
-            language = calendar[2]
-
-            # load and parse the file
-            filename = os.path.join(args.cache_dir, title + "_" + language + ".html")
-            refresh_cache(filename, today, url)
-            with open(filename) as fp:
-                if url.endswith(".ics") or url.startswith("https://framagenda.org/"):
-                    events = scrape_ICal(fp, url, title)
-                else:
-                    soup = BeautifulSoup(fp, "html.parser")
-
-                    # scrape the events depending on the ticketing platform
-                    if url.startswith("https://www.billetweb.fr/shop.php"):
-                        events = list(
-                            map(
-                                tuple_to_event,
-                                scrape_BilletWebShop(soup, title, url, language),
-                            )
-                        )
-                    elif url.startswith("https://www.billetweb.fr/"):
-                        events = list(
-                            map(tuple_to_event, scrape_BilletWeb(soup, title, language))
-                        )
-                    elif url.startswith("https://association.climatefresk.org/"):
-                        events = scrape_FresqueDuClimat(soup, title)
-                    elif url.startswith("https://www.eventbrite."):
-                        events = list(
-                            map(tuple_to_event, scrape_EventBrite(soup, title))
-                        )
-                    elif url.startswith("https://www.watted.ch/"):
-                        events = scrape_Watted_PowerPlay(soup)
-                    else:
-                        raise Exception("URL not handled: " + url)
-
-            print_url = ""
-            if len(events) == 0:
-                print_url = "(" + url + ")"
-            print(len(events), "scraped from", title, "(" + language + ")", print_url)
-            all_events.extend(events)
-
-        count_parsed_events = len(all_events)
-        all_events = append_city_and_filter_for_switzerland(all_events, args.debug)
-        count_swiss_events = len(all_events)
-        seen = set()
-
-        def hasNotBeenSeen(event: sheets.Event) -> bool:
-            newKey = event.name + event.date.strftime("%x") + event.language
-            if newKey in seen:
-                print("Removing duplicate event:", event)
-                return False
-            seen.add(newKey)
-            return True
-
-        all_events = list(filter(hasNotBeenSeen, all_events))
-        print("Removed", count_swiss_events - len(all_events), "duplicated event(s)")
-
-        for event in all_events:
-            # event must have a valid URL
-            if not event.url or not (
-                event.url.startswith("http://")
-                or event.url.startswith("https://")
-                or event.url.startswith("mailto:")
-            ):
-                raise Exception("Invalid URL in event", event)
-
-        with open(args.events_js, "w") as f:
-            template = env.get_template("events.js")
-            print(
-                template.render(
-                    {
-                        "eventsAsJSON": json.dumps(
-                            write_events_as_json(all_events), indent=4
-                        ),
-                    }
-                ),
-                file=f,
+        all_events.extend(
+            sheets.get_manual_events(
+                "10XKUvvU_b-js3kC7Q25VrtYW-flt-qsvwvUThveusOo",
+                "2025!A1:H50",
+                "Workshop name",
+                "Date",
+                "Location",
+                "Link",
+                "Languages",
+                "Live on oneplanetfriends.org",
+                "OPF",
             )
-        print(
-            "Wrote",
-            len(all_events),
-            "events to",
-            args.main_html,
-            "after parsing",
-            count_parsed_events,
-            "events from",
-            len(calendars),
-            "calendars.",
         )
+    print(len(all_events), "added manually.")
+    return all_events
+
+
+# Runs the events of all calendars (lists in calendar order, manual events first) through
+# the pipeline, and publishes them. The event files are only replaced where what is
+# written changed, see output.publish().
+def publish_events(args, env, calendars, calendar_events, today, run_report):
+    # Stream the events through the filters, then to the store and the writers.
+    start = time.perf_counter()
+    take_discarded()
+    count_parsed_events = sum(len(events) for events in calendar_events)
+    resolver = cities.load_resolver(args.location_cache or None)
+    events = merge_calendar_events(calendar_events)
+    events = append_city_and_filter_for_switzerland(events, args.debug, resolver)
+    events = remove_duplicates(events)
+    events = check_urls(events)
+    shards = None
+    if args.shards_dir:
+        shards = EventShardWriter(
+            args.shards_dir, args.shard_by_month, args.compact, args.hashed_names
+        )
+    count_events = 0
+
+    def written(ae):
+        nonlocal count_events
+        for de in write_events_as_json(ae, args.compact):
+            if shards:
+                shards.add(de)
+            count_events += 1
+            yield de
+
+    event_store = None
+    if args.event_store:
+        event_store = store.EventStore(args.event_store)
+        events = event_store.record(events, today)
+    # The changes recorded in the store are dropped if the outputs can't be written.
+    try:
+        if args.events_js:
+            write_events_js(env, args.events_js, written(events), args.compact)
+        else:
+            for _ in written(events):
+                pass
+
+        if args.events_js and not output.publish(args.events_js, args.compact):
+            print("No event changed, keeping", args.events_js)
+        if shards:
+            shards.publish()
+        if event_store:
+            print("Event store:", event_store.changes)
+            event_store.commit()
+    finally:
+        if event_store:
+            event_store.close()
+    resolver.save()
+    run_report.add_stage("publish", time.perf_counter() - start)
+    run_report.add_discarded(take_discarded())
+    run_report.events = count_events
+    print(
+        "Wrote",
+        count_events,
+        "events to",
+        args.main_html,
+        "after parsing",
+        count_parsed_events,
+        "events from",
+        len(calendars),
+        "calendars.",
+    )
+
 
+# Writes the main and about pages.
+def write_pages(args, env, calendars, today):
     if args.main_html:
-        with open(args.main_html, "w") as f:
+        from babel.dates import format_date
+
+        # With shards, the page loads the events through their manifest, relative to it.
+        # With --hashed_names, it references the current versions of the event files.
+        def page_url(filename):
+            if args.hashed_names:
+                filename = output.publish_version(filename)
+            return os.path.relpath(
+                filename, os.path.dirname(os.path.abspath(args.main_html))
+            ).replace(os.sep, "/")
+
+        events_manifest_url = None
+        if args.shards_dir:
+            events_manifest_url = page_url(
+                os.path.join(args.shards_dir, SHARD_MANIFEST)
+            )
+        events_script_url = "events.js"
+        if args.events_js and args.hashed_names:
+            events_script_url = page_url(args.events_js)
+
+        with open(output.temporary_filename(args.main_html), "w") as f:
             template = env.get_template("index.html")
             print(
                 template.render(
                     {
-                        "languageStrings": json.dumps(
-                            sheets.get_language_strings("MainPage", "A1:D50"), indent=4
+                        "languageStrings": dump_json(
+                            sheets.get_language_strings(*MAIN_PAGE_STRINGS),
+                            args.compact,
                         ),
+                        "eventsManifest": events_manifest_url,
+                        "eventsScript": events_script_url,
                         "initialDate": format_date(today, "MM/dd/yyyy", locale="en"),
                         "initialTime": str(
                             math.floor(
@@ -725,18 +1340,20 @@ def main():
                 ),
                 file=f,
             )
+        output.publish(args.main_html, args.compact)
 
     if args.about_prefix:
         calendarList = []
         for calendar in calendars:
             calendarList.append('<a href="' + calendar[3] + '">' + calendar[0] + "</a>")
-        languageStrings = sheets.get_language_strings("AboutPage", "A1:C4")
+        languageStrings = sheets.get_language_strings(*ABOUT_PAGE_STRINGS)
         for languageCode in ["en", "fr"]:
             transposed = {}
             for d in languageStrings:
                 transposed[d["id"]] = d[languageCode]
             languageSuffix = "_" + languageCode + ".html"
-            with open(args.about_prefix + languageSuffix, "w") as f:
+            filename = args.about_prefix + languageSuffix
+            with open(output.temporary_filename(filename), "w") as f:
                 template = env.get_template("about" + languageSuffix)
                 print(
                     template.render(
@@ -749,6 +1366,349 @@ def main():
                     ),
                     file=f,
                 )
+            output.publish(filename, args.compact)
+
+
+# Returns a hash of the events of a calendar, to tell whether they changed.
+def events_fingerprint(events):
+    data = json.dumps([sheets.event_to_list(e) for e in events], ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+# Keeps running, refreshing each calendar when its schedule says so and keeping its events
+# in memory. The event outputs are only written again when the events of a calendar
+# changed, and then only replaced if the merged events changed (see publish_events()), along
+# with the pages. The workshops are read again every day.
+def run_daemon(args, env):
+    if not os.path.exists(args.cache_dir):
+        os.mkdir(args.cache_dir)
+    schedule = scheduler.Scheduler()
+    calendars = []
+    calendar_events = dict()  # calendar -> events of its last successful refresh
+    calendar_metrics = dict()  # calendar name -> metrics of its last refresh
+    all_events = []
+    published = 0
+    # When the workshops are read again, and when the events are published if dirty.
+    # Both are retried after scheduler.RETRY_INTERVAL when they fail, a failed publish
+    # sooner if the workshops or the events of a calendar change in between.
+    reload_at = datetime.datetime.today()
+    publish_at = reload_at
+    dirty = False
+    try:
+        while True:
+            now = datetime.datetime.today()
+            if now >= reload_at:
+                dates.parse_date.cache_clear()  # dates without a year depend on the day
+                try:
+                    sheets.refresh()
+                    new_calendars = read_calendars(args)
+                    all_events = read_manual_events()
+                except Exception as err:
+                    # Keep the workshops and events read before.
+                    print("Failed to read the workshops:", err)
+                    reload_at = now + scheduler.RETRY_INTERVAL
+                else:
+                    calendars = new_calendars
+                    reload_at = datetime.datetime.combine(
+                        now.date() + datetime.timedelta(days=1), datetime.time()
+                    )
+                    schedule.sync({c: cache_freshness(c[1]) for c in calendars}, now)
+                    evict_cache(args.cache_dir, calendars, args.cache_budget * 1e6)
+                    for calendar in list(calendar_events):
+                        if calendar not in calendars:
+                            del calendar_events[calendar]
+                    for name in list(calendar_metrics):
+                        if name not in map(calendar_name, calendars):
+                            del calendar_metrics[name]
+                    dirty = True
+                    publish_at = now
+
+            run_report = report.Report()
+            start = time.perf_counter()
+            for calendar in schedule.due(now):
+                title, url, language = calendar[0:3]
+                filename = cache_filename(args.cache_dir, title, language)
+                calendar_schedule = schedule.get(calendar)
+                # Once the calendar was read, its page is revalidated at each refresh.
+                freshness = None
+                if calendar_schedule.fingerprint is not None:
+                    freshness = datetime.timedelta(0)
+                try:
+                    fetch_start = time.perf_counter()
+                    cache, size = refresh_cache(filename, now, url, freshness)
+                    metrics = {
+                        "fetch_seconds": time.perf_counter() - fetch_start,
+                        "fetch_bytes": size,
+                        "cache": cache,
+                    }
+                    events, parse_metrics = scrape_calendar(
+                        filename,
+                        url,
+                        title,
+                        language,
+                        args.html_parser,
+                        args.ical_horizon,
+                    )
+                except Exception as err:
+                    print("Failed to refresh", calendar_name(calendar) + ":", err)
+                    calendar_schedule.failed(now)
+                    continue
+                metrics.update(parse_metrics)
+                metrics["events"] = len(events)
+                calendar_metrics[calendar_name(calendar)] = metrics
+                if calendar_schedule.succeeded(now, events_fingerprint(events)):
+                    print(len(events), "scraped from", calendar_name(calendar))
+                    calendar_events[calendar] = events
+                    dirty = True
+                    publish_at = now
+            run_report.add_stage("scrape", time.perf_counter() - start)
+
+            if dirty and now >= publish_at:
+                try:
+                    publish_events(
+                        args,
+                        env,
+                        calendars,
+                        [list(all_events)]
+                        + [list(calendar_events.get(c, [])) for c in calendars],
+                        now,
+                        run_report,
+                    )
+                    published = run_report.events
+                    write_pages(args, env, calendars, now)
+                    dirty = False
+                except Exception as err:
+                    # The published files are only replaced once written entirely.
+                    print("Failed to publish the events:", err)
+                    publish_at = now + scheduler.RETRY_INTERVAL
+            run_report.events = published
+            for name, metrics in calendar_metrics.items():
+                run_report.update_calendar(name, metrics)
+            try:
+                if args.report_json:
+                    run_report.write_json(args.report_json)
+                if args.report_prometheus:
+                    run_report.write_prometheus(args.report_prometheus)
+            except OSError as err:
+                print("Failed to write the reports:", err)
+
+            # Sleep until the next calendar is due, the next reload or publishing retry.
+            wake = reload_at
+            if dirty:
+                wake = min(wake, publish_at)
+            next_due = schedule.next_due()
+            if next_due is not None:
+                wake = min(wake, next_due)
+            time.sleep(max(0, (wake - datetime.datetime.today()).total_seconds()))
+    finally:
+        render.close_worker()
+
+
+def main():
+    # Parse the command-line flags.
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "-c",
+        "--cache_dir",
+        default="cache",
+        help="Directory where the pages are cached to reduce host load, see CACHE_FRESHNESS and trim_page().",
+    )
+    argParser.add_argument(
+        "-cb",
+        "--cache_budget",
+        type=float,
+        default=50,
+        help="Size in megabytes above which the cached pages of the workshops no longer enabled are deleted, least recently refreshed first.",
+    )
+    argParser.add_argument(
+        "-ap",
+        "--about_prefix",
+        default=None,
+        help="Output 'about' HTML files to write, disabled if left empty. Don't include the extension as the program will append _<language>.'",
+    )
+    argParser.add_argument(
+        "-e",
+        "--events_js",
+        default=None,
+        help="Output 'events.js' JavaScript file to write, disabled if left empty.",
+    )
+    argParser.add_argument(
+        "-m",
+        "--main_html",
+        default=None,
+        help="Output 'main' HTML file to write, disabled if left empty.",
+    )
+    argParser.add_argument(
+        "-d", "--debug", default=False, help="Whether to output debug information."
+    )
+    argParser.add_argument(
+        "-fw",
+        "--fetch_workers",
+        type=int,
+        default=8,
+        help="Maximum number of calendars downloaded concurrently.",
+    )
+    argParser.add_argument(
+        "-fh",
+        "--fetch_per_host",
+        type=int,
+        default=2,
+        help="Maximum number of concurrent downloads from the same host.",
+    )
+    argParser.add_argument(
+        "-pw",
+        "--parse_workers",
+        type=int,
+        default=0,
+        help="Number of processes parsing the pages, parsing is done in-process if 0.",
+    )
+    argParser.add_argument(
+        "-hp",
+        "--html_parser",
+        default="html.parser",
+        help="BeautifulSoup parser used for the pages, e.g. 'lxml' if installed.",
+    )
+    argParser.add_argument(
+        "-ih",
+        "--ical_horizon",
+        type=int,
+        default=ical.HORIZON_DAYS,
+        help="Number of days ahead within which the events of the ICal calendars are read.",
+    )
+    argParser.add_argument(
+        "-s",
+        "--shards_dir",
+        default=None,
+        help="Directory where to write the events split by linguistic region, disabled if left empty.",
+    )
+    argParser.add_argument(
+        "--shard_by_month",
+        action="store_true",
+        help="Also split the event shards by month.",
+    )
+    argParser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write minified outputs, along with their .gz and .br compressed variants.",
+    )
+    argParser.add_argument(
+        "-es",
+        "--event_store",
+        default="events.sqlite",
+        help="SQLite file recording the published events with when they were first and last seen, and when they were removed. Disabled if left empty.",
+    )
+    argParser.add_argument(
+        "-lc",
+        "--location_cache",
+        default="locations_cache.json",
+        help="JSON file keeping the city of each place between runs, see cities.LocationResolver. Disabled if left empty.",
+    )
+    argParser.add_argument(
+        "-rj",
+        "--report_json",
+        default=None,
+        help="Output JSON file with the timings and counters of the run per calendar and stage, disabled if left empty.",
+    )
+    argParser.add_argument(
+        "-rp",
+        "--report_prometheus",
+        default=None,
+        help="Output file with the same metrics for the Prometheus textfile collector, disabled if left empty.",
+    )
+    argParser.add_argument(
+        "--hashed_names",
+        action="store_true",
+        help="Also publish the event files under names containing a hash of their content, referenced from the main page, so that they can be cached forever.",
+    )
+    argParser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running, refreshing each calendar on its own schedule and rewriting the event outputs when they change, see scheduler.py.",
+    )
+    args = argParser.parse_args()
+    run_report = report.Report()
+
+    env = template_environment()
+    if args.daemon:
+        run_daemon(args, env)
+        return
+    calendars = read_calendars(args)
+    today = datetime.datetime.today()
+
+    if args.events_js or args.shards_dir:
+        # Prepare cache.
+        if not os.path.exists(args.cache_dir):
+            os.mkdir(args.cache_dir)
+
+        all_events = read_manual_events()
+
+        # Add scraped events. Each calendar is parsed as soon as its page lands, but the
+        # results are merged in calendar order so the output doesn't depend on timing.
+        # With --parse_workers, pages are parsed in separate processes to use all cores.
+        parse_pool = None
+        if args.parse_workers > 0:
+            parse_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=args.parse_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        start = time.perf_counter()
+        calendar_events = [None] * len(calendars)
+        for i, filename in fetch_calendars(
+            calendars,
+            args.cache_dir,
+            today,
+            args.fetch_workers,
+            args.fetch_per_host,
+            run_report,
+        ):
+            title, url, language = calendars[i][0:3]
+            if filename is None:
+                calendar_events[i] = ([], dict())
+            elif parse_pool:
+                calendar_events[i] = parse_pool.submit(
+                    scrape_calendar,
+                    filename,
+                    url,
+                    title,
+                    language,
+                    args.html_parser,
+                    args.ical_horizon,
+                )
+            else:
+                calendar_events[i] = scrape_calendar(
+                    filename, url, title, language, args.html_parser, args.ical_horizon
+                )
+        render.close_worker()
+        if parse_pool:
+            calendar_events = [
+                c if isinstance(c, tuple) else c.result() for c in calendar_events
+            ]
+            parse_pool.shutdown()
+        elif args.debug:
+            print("Date parser:", dates.get_stats())
+        run_report.add_stage("scrape", time.perf_counter() - start)
+        evict_cache(args.cache_dir, calendars, args.cache_budget * 1e6)
+
+        for i, (events, metrics) in enumerate(calendar_events):
+            title, url, language = calendars[i][0:3]
+            print_url = ""
+            if len(events) == 0:
+                print_url = "(" + url + ")"
+            print(len(events), "scraped from", title, "(" + language + ")", print_url)
+            metrics["events"] = len(events)
+            run_report.update_calendar(calendar_name(calendars[i]), metrics)
+            calendar_events[i] = events
+
+        publish_events(
+            args, env, calendars, [all_events] + calendar_events, today, run_report
+        )
+
+    write_pages(args, env, calendars, today)
+
+    if args.report_json:
+        run_report.write_json(args.report_json)
+    if args.report_prometheus:
+        run_report.write_prometheus(args.report_prometheus)
 
 
 if __name__ == "__main__":
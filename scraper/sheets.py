@@ -1,13 +1,14 @@
 ﻿import os.path
 import datetime
+import json
+import time
 from typing import List
 
-from google.auth.transport.requests import Request
 from attrs import define, field
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+
+import http_client
+
+# The Google API client is only imported when the API is called, as it is slow to import.
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
@@ -16,10 +17,21 @@ SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
 SAMPLE_SPREADSHEET_ID = "1totCMhD_sRcU1b3JNICTUWXcYoYPOjQRo9KLv8NW4x8"
 
 
-def get_trix(spreadsheetId, spreadsheetRange):
-    """Shows basic usage of the Sheets API.
-    Prints values from a sample spreadsheet.
-    """
+# Values read from the API are saved in this file and reused for SNAPSHOT_TTL seconds,
+# so that repeated runs of the scripts don't call the API at all.
+SNAPSHOT_FILE = "sheets_snapshot.json"
+SNAPSHOT_TTL = 3600
+
+
+# Returns the Sheets API service, asking the user to log in if needed.
+def build_service():
+    import httplib2
+    from google.auth.transport.requests import Request
+    from google_auth_httplib2 import AuthorizedHttp
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+
     creds = None
     # The file token.json stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first
@@ -29,7 +41,7 @@ def get_trix(spreadsheetId, spreadsheetRange):
     # If there are no (valid) credentials available, let the user log in.
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+            creds.refresh(Request(session=http_client.get_session()))
         else:
             flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
             creds = flow.run_local_server(port=0)
@@ -37,25 +49,162 @@ def get_trix(spreadsheetId, spreadsheetRange):
         with open("token.json", "w") as token:
             token.write(creds.to_json())
 
-    try:
-        service = build("sheets", "v4", credentials=creds)
+    # Use the same timeout and retry policy as the scraper.
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=http_client.TIMEOUT[1]))
+    return build("sheets", "v4", http=http)
+
+
+# Stands in for the Sheets API service, serving the values of
+# {spreadsheet id: {range: rows}} without any network access.
+class LocalService:
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range):
+        return self._request(
+            lambda: {"range": range, "values": self.data[spreadsheetId][range]}
+        )
 
-        # Call the Sheets API
-        sheet = service.spreadsheets()
-        result = (
-            sheet.values()
-            .get(spreadsheetId=spreadsheetId, range=spreadsheetRange)
-            .execute()
+    def batchGet(self, spreadsheetId, ranges):
+        return self._request(
+            lambda: {
+                "valueRanges": [
+                    {"range": r, "values": self.data[spreadsheetId][r]} for r in ranges
+                ]
+            }
         )
-        return result.get("values", [])
-    except HttpError as err:
-        print(err)
+
+    def _request(self, response):
+        self.calls += 1
+        return _LocalRequest(response)
+
+
+class _LocalRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self, num_retries=0):
+        return self.response()
+
+
+# Reads values from spreadsheets, building the API service at most once, fetching several
+# ranges of a spreadsheet in one request, and keeping a snapshot of the values on disk.
+class SheetsClient:
+    def __init__(self, service=None, snapshot_file=SNAPSHOT_FILE, ttl=SNAPSHOT_TTL):
+        self._service = service
+        self.snapshot_file = snapshot_file
+        self.ttl = ttl
+        self.values = self._load_snapshot()
+
+    def service(self):
+        if self._service is None:
+            self._service = build_service()
+        return self._service
+
+    def _load_snapshot(self):
+        if not self.snapshot_file:
+            return dict()
+        try:
+            with open(self.snapshot_file) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return dict()
+        if time.time() - snapshot.get("time", 0) > self.ttl:
+            return dict()
+        return snapshot["values"]
+
+    def _save_snapshot(self):
+        if not self.snapshot_file:
+            return
+        with open(self.snapshot_file, "w") as f:
+            json.dump({"time": time.time(), "values": self.values}, f)
+
+    # Fetches all the given ranges of a spreadsheet that are not in the snapshot yet,
+    # with a single batchGet call.
+    def prefetch(self, spreadsheetId, ranges):
+        known = self.values.get(spreadsheetId, dict())
+        missing = [r for r in ranges if r not in known]
+        if not missing:
+            return
+        try:
+            result = (
+                self.service()
+                .spreadsheets()
+                .values()
+                .batchGet(spreadsheetId=spreadsheetId, ranges=missing)
+                .execute(num_retries=http_client.RETRIES)
+            )
+        except Exception as err:
+            from googleapiclient.errors import HttpError
+
+            if not isinstance(err, HttpError):
+                raise
+            print(err)
+            return
+        # The ranges of the response are normalized, but come in the requested order.
+        for r, valueRange in zip(missing, result.get("valueRanges", [])):
+            known[r] = valueRange.get("values", [])
+        self.values[spreadsheetId] = known
+        self._save_snapshot()
+
+    # Returns the rows of a range, or None if it can't be read.
+    def get(self, spreadsheetId, spreadsheetRange):
+        self.prefetch(spreadsheetId, [spreadsheetRange])
+        return self.values.get(spreadsheetId, dict()).get(spreadsheetRange)
+
+    # Drops the values read so far, keeping those of the snapshot if it is still fresh, so
+    # that the next calls read the spreadsheets again. Used by long-running processes.
+    def refresh(self):
+        self.values = self._load_snapshot()
+
+
+_client = None
+
+
+# Returns the process-wide client, see SheetsClient.
+def get_client():
+    global _client
+    if _client is None:
+        _client = SheetsClient()
+    return _client
+
+
+# Replaces the process-wide client, e.g. with one using a LocalService.
+def set_client(client):
+    global _client
+    _client = client
+
+
+# Makes the process-wide client read the spreadsheets again, see SheetsClient.refresh().
+def refresh():
+    get_client().refresh()
+
+
+# Fetches several ranges of a spreadsheet in one request, see SheetsClient.prefetch().
+def prefetch(spreadsheetId, ranges):
+    get_client().prefetch(spreadsheetId, ranges)
+
+
+def get_trix(spreadsheetId, spreadsheetRange):
+    return get_client().get(spreadsheetId, spreadsheetRange)
+
+
+# Returns the spreadsheet range holding language strings.
+def language_strings_range(sheetName, range):
+    return sheetName + "!" + range
 
 
 # Returns an array of dictionaries read from a Google Sheet.
 # The keys of each dictionnary are the values on the first (header) row.
 def get_language_strings(sheetName, range):
-    values = get_trix(SAMPLE_SPREADSHEET_ID, sheetName + "!" + range)
+    values = get_trix(SAMPLE_SPREADSHEET_ID, language_strings_range(sheetName, range))
     a = []
     for row in values[1:]:
         if row[0]:  # skip empty rows
@@ -79,6 +228,36 @@ class Event:
     city: str = None
 
 
+# Returns a compact, JSON-compatible representation of an Event.
+def event_to_list(event: Event) -> list:
+    return [
+        event.name,
+        event.date.isoformat(),
+        event.location,
+        event.url,
+        event.language,
+        event.organizer,
+        event.city,
+    ]
+
+
+# Returns the Event represented by event_to_list().
+def event_from_list(values: list) -> Event:
+    if "T" in values[1]:
+        date = datetime.datetime.fromisoformat(values[1])
+    else:
+        date = datetime.date.fromisoformat(values[1])
+    return Event(
+        name=values[0],
+        date=date,
+        location=values[2],
+        url=values[3],
+        language=values[4],
+        organizer=values[5],
+        city=values[6],
+    )
+
+
 # Returns events read from a Google sheet.
 # The first row is assumed to contain column headers.
 # The header variables the column names to use for each corresponding to Event field.
@@ -134,9 +313,13 @@ class WorkshopMetadata:
     site_link: str
 
 
+# The spreadsheet range listing the calendars.
+WORKSHOPS_RANGE = "Workshops"
+
+
 # Returns the list of calendars to read.
 def get_workshops() -> List[WorkshopMetadata]:
-    values = get_trix(SAMPLE_SPREADSHEET_ID, "Workshops")
+    values = get_trix(SAMPLE_SPREADSHEET_ID, WORKSHOPS_RANGE)
     a = []
     for row in values:
         if row[0] == "TRUE":  # skip non-enabled rows
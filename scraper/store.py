@@ -0,0 +1,90 @@
+import datetime
+import hashlib
+import json
+import sqlite3
+from typing import Iterable, Iterator
+
+import sheets
+
+# Events removed for longer than this many days are deleted from the store.
+RETENTION_DAYS = 365
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    removed TEXT
+);
+CREATE INDEX IF NOT EXISTS events_removed ON events (removed);
+"""
+
+
+# Returns the stable identifier of an event, derived from its workshop, day, language and
+# URL, so that an event keeps its identifier across runs while its other fields change.
+def event_id(event: sheets.Event) -> str:
+    key = "\n".join(
+        [
+            event.name,
+            event.date.strftime("%Y-%m-%d"),
+            event.language or "",
+            event.url or "",
+        ]
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+# Persistent record of the published events, in a SQLite file.
+# Each event is stored under its event_id() with the times it was first and last seen, and
+# the time it stopped being published if it was removed.
+# Changes are only committed by commit(), once the outputs built from them are written.
+class EventStore:
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(_SCHEMA)
+        self.changes = None
+
+    # Records the events passing through as the current events at "now" (a datetime),
+    # yielding them unchanged: new events are inserted and known ones get their data and
+    # last_seen updated. Once all the events went through, the published events that were
+    # not seen are marked removed, and self.changes holds the number of events
+    # {"added": n, "changed": n, "removed": n}.
+    def record(self, events: Iterable[sheets.Event], now) -> Iterator[sheets.Event]:
+        expired = (now - datetime.timedelta(days=RETENTION_DAYS)).isoformat(
+            timespec="seconds"
+        )
+        now = now.isoformat(timespec="seconds")
+        self.changes = {"added": 0, "changed": 0, "removed": 0}
+        for event in events:
+            id = event_id(event)
+            data = json.dumps(sheets.event_to_list(event), ensure_ascii=False)
+            row = self.db.execute(
+                "SELECT data, last_seen, removed FROM events WHERE id = ?", (id,)
+            ).fetchone()
+            if row is None or row[2] is not None:
+                self.changes["added"] += 1
+            elif row[1] != now and row[0] != data:
+                self.changes["changed"] += 1
+            if row is None or row[1] != now:
+                self.db.execute(
+                    "INSERT INTO events (id, data, first_seen, last_seen)"
+                    " VALUES (?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET"
+                    " data = excluded.data, last_seen = excluded.last_seen,"
+                    " removed = NULL",
+                    (id, data, now, now),
+                )
+            yield event
+        cursor = self.db.execute(
+            "UPDATE events SET removed = ? WHERE removed IS NULL AND last_seen != ?",
+            (now, now),
+        )
+        self.changes["removed"] = cursor.rowcount
+        self.db.execute("DELETE FROM events WHERE removed < ?", (expired,))
+
+    def commit(self):
+        self.db.commit()
+
+    # Closes the store, dropping the uncommitted changes.
+    def close(self):
+        self.db.close()
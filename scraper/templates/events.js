@@ -1,2 +1,2 @@
-events = {{ eventsAsJSON }}
-
+events = {% for chunk in eventsAsJSON %}{{ chunk }}{% endfor %}
+eventFacets = {{ facetsAsJSON() }}